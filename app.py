@@ -1,976 +1,78 @@
-import base64
-import html
-import re
+import time
+from collections import OrderedDict
 from datetime import datetime, date
-from pathlib import Path
+from urllib.parse import quote
 
-import pandas as pd
+import numpy as np
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from registry import (
+    DEADLINE_FILTERS,
+    QUALITY_CHECKS,
+    RANK_TOP_K,
+    SORT_OPTIONS,
+    cache_get,
+    cache_put,
+    cache_report,
+    dashboard_tables,
+    date_fmt,
+    display_projection,
+    dom_id,
+    duplicate_report,
+    drive_image_url,
+    ensure_url,
+    esc,
+    export_frame,
+    failed_sources,
+    get_snapshot,
+    history_dir,
+    history_entry_as_of,
+    history_manifest,
+    history_snapshot,
+    html_clean,
+    metric_observe,
+    money_fmt,
+    move_prochie_to_bottom,
+    norm_search,
+    passport_frame,
+    quality_report,
+    readiness_fmt,
+    registry_ids,
+    registry_setting,
+    registry_title,
+    remember_view,
+    risk_report,
+    safe_text,
+    session_seen,
+    snapshot_memory,
+    sorted_positions,
+    source_list,
+    static_assets,
+    status_accent,
+    translate_change_what,
+    view_positions,
+    works_color,
+)
 
 
 # =============================
 # CONFIG
 # =============================
 st.set_page_config(page_title="Реестр объектов", layout="wide")
-
-
-# =============================
-# HELPERS
-# =============================
-def safe_text(v, fallback="—") -> str:
-    if v is None:
-        return fallback
-    try:
-        if pd.isna(v):
-            return fallback
-    except Exception:
-        pass
-    s = str(v).strip()
-    if s.lower() in ("nan", "none", "null", ""):
-        return fallback
-    return s
-
-
-def esc(v) -> str:
-    return html.escape(safe_text(v, fallback="—"))
-
-
-def norm_col(s: str) -> str:
-    if s is None:
-        return ""
-    s = str(s).strip().lower().replace("ё", "е")
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-
-def pick_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
-    cols = {norm_col(c): c for c in df.columns}
-    for cand in candidates:
-        nc = norm_col(cand)
-        if nc in cols:
-            return cols[nc]
-    for cand in candidates:
-        nc = norm_col(cand)
-        if not nc:
-            continue
-        for c in df.columns:
-            if nc in norm_col(c):
-                return c
-    return None
-
-
-def ensure_url(v) -> str:
-    x = safe_text(v, fallback="").strip()
-    if not x or x == "—":
-        return ""
-    if re.match(r"^https?://", x, flags=re.I):
-        return x
-    return ""
-
-
-def read_local_crest_b64() -> str | None:
-    p = Path(__file__).parent / "assets" / "gerb.png"
-    if not p.exists():
-        return None
-    return base64.b64encode(p.read_bytes()).decode("utf-8")
-
-
-def move_prochie_to_bottom(items: list[str]) -> list[str]:
-    if not items:
-        return items
-
-    def is_prochie(x: str) -> bool:
-        nx = norm_col(x)
-        return nx in ("прочие", "прочее")
-
-    prochie = [x for x in items if is_prochie(x)]
-    rest = [x for x in items if not is_prochie(x)]
-    return rest + prochie
-
-
-def status_accent(status_text: str) -> str:
-    s = norm_col(status_text)
-    if "останов" in s or "приостанов" in s:
-        return "red"
-    if "проектир" in s:
-        return "yellow"
-    if "строитель" in s:
-        return "green"
-    return "blue"
-
-
-def works_color(work_flag: str) -> str:
-    s = norm_col(work_flag)
-    if s in ("—", "", "нет", "не ведутся", "не ведутся.", "не ведутся.."):
-        return "red"
-    if "не вед" in s or "не выполня" in s or "отсутств" in s:
-        return "red"
-    if s == "да" or "ведут" in s or "выполня" in s or "идут" in s:
-        return "green"
-    return "gray"
-
-
-def try_parse_date(v) -> date | None:
-    if v is None:
-        return None
-    try:
-        if pd.isna(v):
-            return None
-    except Exception:
-        pass
-
-    if isinstance(v, date) and not isinstance(v, datetime):
-        return v
-    if isinstance(v, datetime):
-        return v.date()
-
-    s = str(v).strip()
-    if not s or s.lower() in ("nan", "none", "null", "—"):
-        return None
-
-    # serial date (Google/Excel)
-    if re.fullmatch(r"\d+(\.\d+)?", s):
-        try:
-            num = float(s)
-            dt = pd.to_datetime(num, unit="D", origin="1899-12-30", errors="coerce")
-            if pd.isna(dt):
-                return None
-            return dt.date()
-        except Exception:
-            return None
-
-    for fmt in ("%d.%m.%Y", "%d.%m.%y", "%Y-%m-%d", "%Y/%m/%d"):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except Exception:
-            pass
-
-    try:
-        dt = pd.to_datetime(s, errors="coerce", dayfirst=True)
-        if pd.isna(dt):
-            return None
-        return dt.date()
-    except Exception:
-        return None
-
-
-def date_fmt(v) -> str:
-    d = try_parse_date(v)
-    return d.strftime("%d.%m.%Y") if d else "—"
-
-
-def update_color(updated_at_value) -> tuple[str, str]:
-    d = try_parse_date(updated_at_value)
-    if not d:
-        return "gray", "—"
-    days = (date.today() - d).days
-    if days <= 7:
-        return "green", d.strftime("%d.%m.%Y")
-    if days <= 14:
-        return "yellow", d.strftime("%d.%m.%Y")
-    return "red", d.strftime("%d.%m.%Y")
-
-
-def money_fmt(v) -> str:
-    s = safe_text(v, fallback="—")
-    if s == "—":
-        return s
-    try:
-        x = str(s).replace(" ", "").replace("\u00A0", "").replace(",", ".")
-        x = float(x)
-        return f"{x:,.2f}".replace(",", " ").replace(".00", "") + " ₽"
-    except Exception:
-        return s if ("₽" in s or "руб" in s.lower()) else f"{s} ₽"
-
-
-def readiness_fmt(v) -> str:
-    s = safe_text(v, fallback="—")
-    if s == "—":
-        return "—"
-    s0 = str(s).strip()
-    if not s0:
-        return "—"
-    if "%" in s0:
-        return s0.replace(" ", "")
-
-    try:
-        x = str(s0).replace(" ", "").replace("\u00A0", "").replace(",", ".")
-        x = float(x)
-        p = x * 100 if 0 <= x <= 1 else x
-        if abs(p - round(p)) < 1e-9:
-            return f"{int(round(p))}%"
-        return f"{p:.1f}".replace(".", ",") + "%"
-    except Exception:
-        return s0
-
-
-def norm_search(s: str) -> str:
-    s = safe_text(s, fallback="")
-    s = s.lower().replace("ё", "е")
-    s = re.sub(r"[^\w\s\-\/\.]", " ", s, flags=re.UNICODE)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
-def html_clean(s: str) -> str:
-    """Убираем отступы, чтобы Streamlit не превращал HTML в code-block."""
-    if s is None:
-        return ""
-    lines = str(s).splitlines()
-    return "\n".join([ln.lstrip() for ln in lines]).strip()
-
-
-# Фото: Google Drive link -> прямая картинка
-def extract_drive_file_id(url: str) -> str:
-    u = safe_text(url, fallback="").strip()
-    if not u:
-        return ""
-    m = re.search(r"/file/d/([a-zA-Z0-9_-]+)", u)
-    if m:
-        return m.group(1)
-    m = re.search(r"[?&]id=([a-zA-Z0-9_-]+)", u)
-    if m:
-        return m.group(1)
-    return ""
-
-
-def drive_image_url(url: str, width: int = 1200) -> str:
-    fid = extract_drive_file_id(url)
-    if not fid:
-        return ""
-    return f"https://drive.google.com/thumbnail?id={fid}&sz=w{int(width)}"
-
-
-# =============================
-# SEARCH: abbreviations
-# =============================
-ABBR = {
-    "фап": ["фельдшерско-акушерский пункт", "фельдшерско акушерский пункт"],
-    "одкб": ["областная детская клиническая больница", "детская областная клиническая больница"],
-    "црб": ["центральная районная больница"],
-    "фок": ["физкультурно-оздоровительный комплекс", "физкультурно оздоровительный комплекс"],
-    "дк": ["дом культуры", "дворец культуры"],
-    "сош": ["средняя общеобразовательная школа", "школа"],
-    "оош": ["основная общеобразовательная школа"],
-    "доу": ["дошкольное образовательное учреждение", "детский сад"],
-}
-
-
-def expand_query_tokens(q: str) -> list[str]:
-    qn = norm_search(q)
-    if not qn:
-        return []
-    parts = qn.split()
-    out = set(parts)
-    out.add(qn)
-    for p in parts:
-        if p in ABBR:
-            for full in ABBR[p]:
-                out.add(norm_search(full))
-    return [x for x in out if x]
-
-
-def build_row_search_blob(row: pd.Series) -> str:
-    base = " ".join(
-        [
-            safe_text(row.get("name", ""), ""),
-            safe_text(row.get("object_type", ""), ""),
-            safe_text(row.get("address", ""), ""),
-            safe_text(row.get("responsible", ""), ""),
-            safe_text(row.get("sector", ""), ""),
-            safe_text(row.get("district", ""), ""),
-            safe_text(row.get("status", ""), ""),
-            safe_text(row.get("issues", ""), ""),
-        ]
-    )
-    blob = norm_search(base)
-
-    for abbr, expansions in ABBR.items():
-        for full in expansions:
-            full_n = norm_search(full)
-            if full_n and full_n in blob:
-                blob += " " + abbr
-        if re.search(rf"\b{re.escape(abbr)}\b", blob):
-            for full in expansions:
-                blob += " " + norm_search(full)
-
-    return blob
-
-
-# =============================
-# CHANGE: RU labels
-# =============================
-CHANGE_KEY_RU = {
-    "status": "Статус",
-    "works_in_progress": "Работы",
-    "work_flag": "Работы",
-    "issues": "Проблемы",
-    "contractor": "Подрядчик",
-    "contract": "Контракт",
-    "contract_date": "Дата контракта",
-    "contract_price": "Цена контракта",
-    "paid": "Оплачено",
-    "end_date_plan": "Окончание (план)",
-    "end_date_fact": "Окончание (факт)",
-    "target_deadline": "Целевой срок",
-    "readiness": "Готовность",
-    "rns": "РНС",
-    "rns_date": "Дата РНС",
-    "rns_expiry": "Срок РНС",
-    "expertise": "Экспертиза",
-    "expertise_conclusion": "Заключение экспертизы",
-    "expertise_date": "Дата экспертизы",
-    "design": "ПСД",
-    "psd_cost": "Стоимость ПСД",
-    "designer": "Проектировщик",
-    "agreement": "Соглашение",
-    "agreement_date": "Дата соглашения",
-    "agreement_amount": "Сумма соглашения",
-}
-
-
-def translate_change_what(raw: str) -> str:
-    s = safe_text(raw, "—").strip()
-    if s == "—" or not s:
-        return "—"
-
-    parts = re.split(r"[|,;\n]+", s)
-    parts = [p.strip() for p in parts if p.strip()]
-
-    out = []
-    for p in parts:
-        key = norm_col(p)
-        out.append(CHANGE_KEY_RU.get(key, p))
-
-    uniq = []
-    for x in out:
-        if x not in uniq:
-            uniq.append(x)
-
-    return ", ".join(uniq) if uniq else "—"
-
-
-# =============================
-# DATA LOADING
-# =============================
-@st.cache_data(show_spinner=False, ttl=120)
-def load_data() -> pd.DataFrame:
-    csv_url = None
-    try:
-        csv_url = st.secrets.get("CSV_URL", None)
-    except Exception:
-        csv_url = None
-
-    df = pd.DataFrame()
-
-    if csv_url:
-        try:
-            df = pd.read_csv(csv_url)
-        except Exception:
-            try:
-                df = pd.read_csv(csv_url, sep=";")
-            except Exception:
-                df = pd.DataFrame()
-
-    if df.empty:
-        candidates = [
-            "РЕЕСТР_объектов_Курская_область_2025-2028.xlsx",
-            "registry.xlsx",
-            "data.xlsx",
-        ]
-        for name in candidates:
-            p = Path(__file__).parent / name
-            if p.exists():
-                try:
-                    df = pd.read_excel(p, sheet_name=0)
-                    break
-                except Exception:
-                    pass
-
-    if df is None or df.empty:
-        return pd.DataFrame()
-
-    df.columns = [str(c).strip() for c in df.columns]
-    return df
-
-
-def normalize_schema(df: pd.DataFrame) -> pd.DataFrame:
-    if df.empty:
-        return df
-
-    def col(*cands):
-        return pick_col(df, list(cands))
-
-    out = pd.DataFrame()
-
-    out["id"] = df[col("id", "ID")] if col("id", "ID") else ""
-    out["sector"] = df[col("sector", "отрасль")] if col("sector", "отрасль") else ""
-    out["district"] = df[col("district", "район")] if col("district", "район") else ""
-    out["name"] = df[col("name", "object_name", "наименование_объекта", "наименование объекта", "объект")] if col(
-        "name", "object_name", "наименование_объекта", "наименование объекта", "объект"
-    ) else ""
-    out["object_type"] = df[col("object_type", "тип", "вид объекта")] if col("object_type", "тип", "вид объекта") else ""
-    out["address"] = df[col("address", "адрес")] if col("address", "адрес") else ""
-    out["responsible"] = df[col("responsible", "ответственный")] if col("responsible", "ответственный") else ""
-    out["status"] = df[col("status", "статус")] if col("status", "статус") else ""
-
-    # works_in_progress / works
-    out["work_flag"] = df[col("works_in_progress", "work_flag", "работы", "works")] if col(
-        "works_in_progress", "work_flag", "работы", "works"
-    ) else ""
-
-    out["issues"] = df[col("issues", "проблемы", "проблемные вопросы")] if col(
-        "issues", "проблемы", "проблемные вопросы"
-    ) else ""
-
-    # (не показываем отдельным чипом, но используем, если нужно)
-    out["updated_at"] = df[col("updated_at", "last_update", "обновлено", "updated")] if col(
-        "updated_at", "last_update", "обновлено", "updated"
-    ) else ""
-
-    out["card_url_text"] = df[
-        col("card_url_text", "card_url", "ссылка_на_карточку_(google)", "ссылка на карточку", "ссылка_на_карточку")
-    ] if col("card_url_text", "card_url", "ссылка_на_карточку_(google)", "ссылка на карточку", "ссылка_на_карточку") else ""
-
-    out["photo_url"] = df[col("photo_url", "photo", "фото", "ссылка_на_фото", "ссылка на фото")] if col(
-        "photo_url", "photo", "фото", "ссылка_на_фото", "ссылка на фото"
-    ) else ""
-
-    # --- Изменения (новые колонки реестра) ---
-    out["card_updated_at"] = df[col("card_updated_at", "card_updated_drive", "card_updated_at", "обновлено_карточка")] if col(
-        "card_updated_at", "card_updated_drive", "card_updated_at", "обновлено_карточка"
-    ) else ""
-    out["change_level"] = df[col("change_level", "уровень_изменения", "значимость", "change_severity")] if col(
-        "change_level", "уровень_изменения", "значимость", "change_severity"
-    ) else ""
-    out["change_what"] = df[col("change_what", "что_изменили", "what_changed")] if col(
-        "change_what", "что_изменили", "what_changed"
-    ) else ""
-    out["change_note"] = df[col("change_note", "комментарий", "comment")] if col(
-        "change_note", "комментарий", "comment"
-    ) else ""
-
-    # Паспортные поля (как было)
-    out["state_program"] = df[col("state_program", "гп", "государственная программа")] if col(
-        "state_program", "гп", "государственная программа"
-    ) else ""
-    out["federal_project"] = df[col("federal_project", "фп", "федеральный проект")] if col(
-        "federal_project", "фп", "федеральный проект"
-    ) else ""
-    out["regional_program"] = df[col("regional_program", "рп", "региональная программа")] if col(
-        "regional_program", "рп", "региональная программа"
-    ) else ""
-
-    out["agreement"] = df[col("agreement", "соглашение", "номер соглашения")] if col(
-        "agreement", "соглашение", "номер соглашения"
-    ) else ""
-    out["agreement_date"] = df[col("agreement_date", "дата соглашения")] if col("agreement_date", "дата соглашения") else ""
-    out["agreement_amount"] = df[col("agreement_amount", "сумма соглашения")] if col("agreement_amount", "сумма соглашения") else ""
-
-    out["capacity_seats"] = df[col("capacity_seats", "мощность", "мест", "посещений")] if col(
-        "capacity_seats", "мощность", "мест", "посещений"
-    ) else ""
-    out["area_m2"] = df[col("area_m2", "площадь", "м2", "кв.м")] if col("area_m2", "площадь", "м2", "кв.м") else ""
-    out["target_deadline"] = df[col("target_deadline", "целевой срок")] if col("target_deadline", "целевой срок") else ""
-
-    out["design"] = df[col("design", "проектирование", "псд")] if col("design", "проектирование", "псд") else ""
-    out["psd_cost"] = df[col("psd_cost", "стоимость псд")] if col("psd_cost", "стоимость псд") else ""
-    out["designer"] = df[col("designer", "проектировщик")] if col("designer", "проектировщик") else ""
-
-    out["expertise"] = df[col("expertise", "экспертиза")] if col("expertise", "экспертиза") else ""
-    out["expertise_conclusion"] = df[col("expertise_conclusion", "заключение экспертизы")] if col(
-        "expertise_conclusion", "заключение экспертизы"
-    ) else ""
-    out["expertise_date"] = df[col("expertise_date", "дата экспертизы")] if col("expertise_date", "дата экспертизы") else ""
-
-    out["rns"] = df[col("rns", "рнс")] if col("rns", "рнс") else ""
-    out["rns_date"] = df[col("rns_date", "дата рнс")] if col("rns_date", "дата рнс") else ""
-    out["rns_expiry"] = df[col("rns_expiry", "срок действия рнс")] if col("rns_expiry", "срок действия рнс") else ""
-
-    out["contract"] = df[col("contract", "контракт", "номер контракта")] if col(
-        "contract", "контракт", "номер контракта"
-    ) else ""
-    out["contract_date"] = df[col("contract_date", "дата контракта")] if col("contract_date", "дата контракта") else ""
-    out["contractor"] = df[col("contractor", "подрядчик")] if col("contractor", "подрядчик") else ""
-    out["contract_price"] = df[col("contract_price", "цена контракта", "стоимость контракта")] if col(
-        "contract_price", "цена контракта", "стоимость контракта"
-    ) else ""
-
-    out["end_date_plan"] = df[col("end_date_plan", "окончание план")] if col("end_date_plan", "окончание план") else ""
-    out["end_date_fact"] = df[col("end_date_fact", "окончание факт")] if col("end_date_fact", "окончание факт") else ""
-    out["readiness"] = df[col("readiness", "готовность")] if col("readiness", "готовность") else ""
-    out["paid"] = df[col("paid", "оплачено")] if col("paid", "оплачено") else ""
-
-    for c in out.columns:
-        out[c] = out[c].astype(str).replace({"nan": "", "None": "", "null": ""})
-
-    return out
+run_t0 = time.perf_counter()
+run_ctx = get_script_run_ctx()
+if run_ctx is not None:
+    session_seen(run_ctx.session_id)
 
 
 # =============================
 # STYLES
 # =============================
-crest_b64 = read_local_crest_b64()
-
-st.markdown(
-    html_clean(
-        """
-<style>
-:root{
-  --text: #0f172a;
-  --muted: rgba(15,23,42,.70);
-  --page: radial-gradient(1100px 520px at 24% 18%, rgba(59,130,246,.08), rgba(0,0,0,0) 56%),
-          radial-gradient(900px 480px at 78% 22%, rgba(16,185,129,.07), rgba(0,0,0,0) 56%),
-          linear-gradient(180deg, #f6f8fc, #eef2f7);
-  --border: rgba(15,23,42,.14);
-  --border-strong: rgba(15,23,42,.20);
-  --shadow: rgba(0,0,0,.07);
-
-  --chip-bg: rgba(15,23,42,.05);
-  --chip-bd: rgba(15,23,42,.10);
-
-  --soft: linear-gradient(180deg, rgba(255,255,255,.98), rgba(245,248,255,.98));
-  --soft2: linear-gradient(180deg, rgba(255,255,255,.96), rgba(246,248,255,.98));
-
-  --btn-bg: rgba(255,255,255,.96);
-  --btn-bd: rgba(15,23,42,.18);
-  --btn-shadow: rgba(0,0,0,.08);
-}
-
-.block-container { padding-top: 24px !important; max-width: 1200px; }
-@media (max-width: 1200px){ .block-container { max-width: 96vw; } }
-div[data-testid="stHorizontalBlock"]{ gap: 14px; }
-
-#MainMenu {visibility: hidden;}
-footer {visibility: hidden;}
-header {visibility: hidden;}
-
-html, body, [data-testid="stAppViewContainer"]{
-  background: var(--page) !important;
-}
-
-/* фикс цвета текста на мобиле */
-html, body, [data-testid="stAppViewContainer"], [data-testid="stAppViewContainer"] *{
-  color: var(--text);
-}
-p, span, li, div, small { color: var(--text); }
-.stCaption, [data-testid="stCaptionContainer"] * { color: var(--muted) !important; }
-label, [data-testid="stWidgetLabel"] *{
-  color: var(--text) !important;
-  opacity: 1 !important;
-}
-h1,h2,h3,h4,h5,h6{ color: var(--text) !important; }
-
-/* =========================
-   FIX: Android/MIUI dark inputs (BaseWeb)
-   ========================= */
-div[data-baseweb="input"] > div,
-div[data-baseweb="select"] > div{
-  background: rgba(255,255,255,.96) !important;
-  color: var(--text) !important;
-  border-color: rgba(15,23,42,.20) !important;
-}
-div[data-baseweb="input"] input{
-  background: rgba(255,255,255,.96) !important;
-  color: var(--text) !important;
-  -webkit-text-fill-color: var(--text) !important;
-  caret-color: var(--text) !important;
-}
-div[data-baseweb="select"] input{
-  background: rgba(255,255,255,.96) !important;
-  color: var(--text) !important;
-  -webkit-text-fill-color: var(--text) !important;
-}
-div[data-baseweb="popover"],
-div[data-baseweb="menu"]{
-  background: #ffffff !important;
-  color: var(--text) !important;
-  border: 1px solid rgba(15,23,42,.14) !important;
-  border-radius: 14px !important;
-  box-shadow: 0 18px 32px rgba(0,0,0,.14) !important;
-}
-div[role="listbox"]{ background: #ffffff !important; }
-div[role="option"]{ background: #ffffff !important; color: var(--text) !important; }
-div[role="option"]:hover{ background: rgba(15,23,42,.06) !important; }
-
-/* кнопки (в т.ч. submit в форме) */
-div.stButton > button,
-div[data-testid="stFormSubmitButton"] > button{
-  background: rgba(255,255,255,.96) !important;
-  color: var(--text) !important;
-  border: 1px solid rgba(15,23,42,.18) !important;
-  border-radius: 12px !important;
-  box-shadow: 0 10px 18px rgba(0,0,0,.08) !important;
-  opacity: 1 !important;
-}
-
-/* HERO */
-.hero-wrap{ width:100%; display:flex; justify-content:center; margin-bottom: 10px; }
-.hero{
-  width: 100%;
-  border-radius: 18px;
-  padding: 18px 18px;
-  background: radial-gradient(1200px 380px at 22% 30%, rgba(60,130,255,.22), rgba(0,0,0,0) 55%),
-              linear-gradient(135deg, #0b2a57, #1b4c8f);
-  box-shadow: 0 18px 34px rgba(0,0,0,.18);
-  position: relative;
-  overflow: hidden;
-}
-.hero:after{
-  content:"";
-  position:absolute;
-  inset:-40px -120px auto auto;
-  width: 520px; height: 320px;
-  background: rgba(255,255,255,.08);
-  transform: rotate(14deg);
-  border-radius: 32px;
-}
-.hero-row{ display:flex; align-items:flex-start; gap: 16px; position: relative; z-index: 2; }
-.hero-crest{
-  width: 74px; height: 74px;
-  border-radius: 14px;
-  background: rgba(255,255,255,.10);
-  display:flex; align-items:center; justify-content:center;
-  border: 1px solid rgba(255,255,255,.16);
-  flex: 0 0 auto;
-}
-.hero-crest img{
-  width: 56px; height: 56px; object-fit: contain;
-  filter: drop-shadow(0 6px 10px rgba(0,0,0,.35));
-}
-.hero-titles{ flex: 1 1 auto; min-width: 0; }
-.hero-ministry{ color: rgba(255,255,255,.95) !important; font-weight: 900; font-size: 20px; line-height: 1.15; }
-.hero-app{ margin-top: 6px; color: rgba(255,255,255,.92) !important; font-weight: 800; font-size: 16px; }
-.hero-sub{ margin-top: 6px; color: rgba(255,255,255,.78) !important; font-size: 13px; }
-@media (max-width: 900px){
-  .hero-ministry{ font-size: 16px; }
-  .hero-row{ align-items:center; }
-}
-
-/* панельки фильтров */
-div[data-testid="stSelectbox"], div[data-testid="stTextInput"]{
-  background: linear-gradient(180deg, rgba(255,255,255,.86), rgba(245,248,255,.94));
-  border: 1px solid rgba(15,23,42,.16);
-  border-radius: 16px;
-  padding: 10px 10px 6px 10px;
-  box-shadow: 0 14px 26px rgba(0,0,0,.08);
-}
-div[data-testid="stTextInput"] input,
-div[data-testid="stSelectbox"] div[role="combobox"]{
-  border: 1px solid rgba(15,23,42,.20) !important;
-  box-shadow: 0 10px 18px rgba(0,0,0,.06) !important;
-  background: rgba(255,255,255,.96) !important;
-  border-radius: 12px !important;
-}
-
-/* карточка */
-.card{
-  background:
-    radial-gradient(900px 320px at 14% 12%, rgba(59,130,246,.08), rgba(0,0,0,0) 55%),
-    radial-gradient(700px 260px at 92% 18%, rgba(16,185,129,.06), rgba(0,0,0,0) 55%),
-    linear-gradient(180deg, #ffffff, #f4f8ff);
-  border: 1px solid var(--border);
-  border-radius: 16px;
-  padding: 22px;
-  box-shadow: 0 10px 22px var(--shadow);
-  margin-bottom: 14px;
-  position: relative;
-}
-.card[data-accent="green"]{
-  border-color: rgba(34,197,94,.35);
-  box-shadow: 0 10px 22px var(--shadow),
-              inset 12px 0 0 rgba(34,197,94,.55),
-              0 0 18px rgba(34,197,94,.12);
-}
-.card[data-accent="yellow"]{
-  border-color: rgba(245,158,11,.38);
-  box-shadow: 0 10px 22px var(--shadow),
-              inset 12px 0 0 rgba(245,158,11,.58),
-              0 0 18px rgba(245,158,11,.12);
-}
-.card[data-accent="red"]{
-  border-color: rgba(239,68,68,.38);
-  box-shadow: 0 10px 22px var(--shadow),
-              inset 12px 0 0 rgba(239,68,68,.58),
-              0 0 18px rgba(239,68,68,.12);
-}
-.card[data-accent="blue"]{
-  border-color: rgba(59,130,246,.32);
-  box-shadow: 0 10px 22px var(--shadow),
-              inset 12px 0 0 rgba(59,130,246,.52),
-              0 0 18px rgba(59,130,246,.10);
-}
-.card-title{ font-size: 20px; line-height: 1.15; font-weight: 900; margin: 0 0 10px 0; }
-.card-subchips{ display:flex; gap: 8px; flex-wrap: wrap; margin-top: -2px; margin-bottom: 12px; }
-.chip{
-  display:inline-flex; align-items:center; gap: 8px;
-  padding: 6px 10px; border-radius: 999px;
-  border: 1px solid var(--chip-bd);
-  background: var(--chip-bg);
-  font-size: 13px; font-weight: 800;
-}
-
-/* фото */
-.photo-wrap{
-  width: 100%;
-  border-radius: 14px;
-  border: 1px solid rgba(15,23,42,.12);
-  background: rgba(255,255,255,.88);
-  overflow: hidden;
-  box-shadow: 0 12px 22px rgba(0,0,0,.08);
-  margin: 10px 0 14px 0;
-  position: relative;
-}
-.photo-wrap:after{
-  content:"";
-  position:absolute;
-  inset:0;
-  pointer-events:none;
-  background: linear-gradient(180deg, rgba(255,255,255,.16), rgba(255,255,255,0) 48%),
-              radial-gradient(900px 260px at 14% 12%, rgba(59,130,246,.10), rgba(0,0,0,0) 55%);
-}
-.photo{
-  display:block;
-  width:100%;
-  height:auto;
-  aspect-ratio: 16 / 9;
-  object-fit: cover;
-  max-height: 280px;
-}
-@media (max-width: 900px){
-  .photo{ aspect-ratio: 4 / 3; max-height: 220px; }
-}
+assets = static_assets()
+crest_b64 = assets["crest_b64"]
 
-/* адрес */
-.addr-row{ margin-top: 8px; font-size: 14px; }
-.addr-row b{ font-weight: 900; }
-
-/* теги + правый блок */
-.tags-row{
-  display:flex;
-  align-items:flex-start;
-  justify-content: space-between;
-  gap: 12px;
-  margin-top: 12px;
-  flex-wrap: wrap;
-}
-.tags-left{ display:flex; gap: 10px; flex-wrap: wrap; align-items:center; }
-.tag{
-  display:inline-flex; align-items:center; gap: 8px;
-  padding: 6px 10px; border-radius: 999px;
-  border: 1px solid var(--chip-bd);
-  background: var(--chip-bg);
-  font-size: 13px; font-weight: 800;
-}
-.tag-gray{ opacity: .92; }
-.tag-green{ background: rgba(34,197,94,.12); border-color: rgba(34,197,94,.22); }
-.tag-yellow{ background: rgba(245,158,11,.14); border-color: rgba(245,158,11,.25); }
-.tag-red{ background: rgba(239,68,68,.12); border-color: rgba(239,68,68,.22); }
-
-.right-stack{
-  display:flex;
-  flex-direction: column;
-  align-items: flex-end;
-  gap: 8px;
-  min-width: 260px;
-}
-@media (max-width: 900px){
-  .right-stack{ align-items: flex-start; min-width: unset; width: 100%; }
-}
-.right-row{
-  display:flex;
-  gap: 10px;
-  align-items:center;
-  flex-wrap: wrap;
-  justify-content: flex-end;
-}
-@media (max-width: 900px){
-  .right-row{ justify-content: flex-start; }
-}
-
-.resp-chip{
-  display:inline-flex;
-  align-items:center;
-  gap: 8px;
-  padding: 6px 10px;
-  border-radius: 999px;
-  border: 1px solid rgba(15,23,42,.12);
-  background: rgba(255,255,255,.86);
-  font-size: 13px;
-  font-weight: 900;
-  box-shadow: 0 10px 18px rgba(0,0,0,.06);
-  white-space: nowrap;
-}
-.resp-chip .muted{ font-weight: 800; color: rgba(15,23,42,.70) !important; }
-@media (max-width: 900px){
-  .resp-chip{ white-space: normal; }
-}
-
-/* чип изменения (кликабельный, без прыжков страницы) */
-.chg-toggle{ position:absolute; opacity:0; pointer-events:none; }
-.chg-chip{
-  cursor: pointer;
-  user-select: none;
-  position: relative;
-}
-.chg-chip:after{
-  content:"";
-  position:absolute;
-  inset:-2px;
-  border-radius: 999px;
-  pointer-events:none;
-  opacity:0;
-}
-.chg-toggle:checked + .chg-chip{
-  box-shadow: 0 12px 22px rgba(0,0,0,.10);
-  transform: translateY(-1px);
-}
-.chg-body{
-  display:none;
-  margin-top: 8px;
-  padding: 10px 12px;
-  border-radius: 14px;
-  border: 1px dashed rgba(15,23,42,.16);
-  background: rgba(255,255,255,.86);
-  box-shadow: 0 10px 18px rgba(0,0,0,.06);
-  width: 100%;
-  max-width: 520px;
-}
-.chg-toggle:checked ~ .chg-body{ display:block; }
-
-/* пульсация для “Важно” */
-@keyframes pulseRed {
-  0%   { box-shadow: 0 0 0 rgba(239,68,68,.0); }
-  50%  { box-shadow: 0 0 18px rgba(239,68,68,.28); }
-  100% { box-shadow: 0 0 0 rgba(239,68,68,.0); }
-}
-.chg-major{
-  animation: pulseRed 1.6s ease-in-out infinite;
-}
-
-/* кнопка */
-.a-btn{
-  width: 100%;
-  display:flex; justify-content:center; align-items:center; gap: 8px;
-  padding: 10px 12px;
-  border-radius: 12px;
-  border: 1px solid var(--btn-bd);
-  background: var(--btn-bg);
-  text-decoration:none !important;
-  font-weight: 900;
-  font-size: 14px;
-  transition: .12s ease-in-out;
-  margin-top: 14px;
-  box-shadow: 0 10px 18px var(--btn-shadow);
-}
-.a-btn:hover{ transform: translateY(-1px); box-shadow: 0 14px 22px rgba(0,0,0,.10); }
-.a-btn.disabled{ opacity: .45; pointer-events:none; }
-
-/* паспорт */
-.passport{
-  margin-top: 14px;
-  border-radius: 14px;
-  border: 1px solid var(--border-strong);
-  background: var(--soft2);
-  overflow: hidden;
-  box-shadow: 0 10px 18px rgba(0,0,0,.06);
-}
-.passport-toggle{
-  position: absolute;
-  opacity: 0;
-  pointer-events: none;
-}
-.passport-summary{
-  cursor: pointer;
-  padding: 12px 12px;
-  font-weight: 900;
-  display:flex;
-  align-items:center;
-  gap: 10px;
-  user-select: none;
-}
-.passport-summary:before{ content: "▸"; font-weight: 900; opacity: .7; }
-.passport-toggle:checked + .passport-summary:before{ content: "▾"; }
-
-.passport-body{
-  display: none;
-  padding: 12px 12px 14px 12px;
-  border-top: 1px dashed rgba(15,23,42,.12);
-}
-.passport-toggle:checked ~ .passport-body{ display: block; }
-
-.passport-grid{
-  display: grid;
-  grid-template-columns: 1fr 1fr;
-  gap: 12px;
-}
-.section-wide{ grid-column: 1 / -1; }
-
-.section{
-  margin-top: 0;
-  padding: 12px;
-  border-radius: 14px;
-  border: 1px solid rgba(15,23,42,.12);
-  background: var(--soft);
-}
-.section-title{ font-weight: 900; margin-bottom: 8px; font-size: 14px; }
-
-.row{
-  display:flex;
-  gap: 10px;
-  flex-wrap: wrap;
-  font-size: 13.5px;
-  line-height: 1.35;
-  word-break: break-word;
-  overflow-wrap: anywhere;
-}
-.row b{ font-weight: 900; }
-.row .muted{ color: var(--muted) !important; }
-
-.issue-box{
-  border: 1px solid rgba(239,68,68,.22);
-  background: rgba(239,68,68,.07);
-  padding: 10px 12px;
-  border-radius: 12px;
-  font-size: 13.5px;
-  line-height: 1.35;
-  word-break: break-word;
-  overflow-wrap: anywhere;
-}
-
-.passport-close{
-  display: none;
-  justify-content:center;
-  margin: 10px 0 12px 0;
-}
-.passport-toggle:checked ~ .passport-close{ display:flex; }
-.passport-close-btn{
-  width: 34px;
-  height: 34px;
-  border-radius: 999px;
-  border: 1px solid rgba(15,23,42,.18);
-  background: rgba(255,255,255,.92);
-  font-weight: 900;
-  display:flex;
-  align-items:center;
-  justify-content:center;
-  line-height: 1;
-  transition: .12s ease-in-out;
-  cursor: pointer;
-  user-select: none;
-  box-shadow: 0 10px 18px rgba(0,0,0,.08);
-}
-.passport-close-btn:hover{ transform: translateY(-1px); box-shadow: 0 14px 22px rgba(0,0,0,.10); }
-
-@media (max-width: 900px){
-  .card-title{ font-size: 18px; }
-  .passport-grid{ grid-template-columns: 1fr; }
-}
-</style>
-"""
-    ),
-    unsafe_allow_html=True,
-)
+st.markdown(assets["style_html"], unsafe_allow_html=True)
 
 
 # =============================
@@ -1004,22 +106,47 @@ st.markdown(
 
 
 # =============================
-# AUTH
+# REGISTRY
 # =============================
-def get_app_password() -> str | None:
-    try:
-        return st.secrets.get("APP_PASSWORD", None)
-    except Exception:
-        return None
+# несколько реестров в Secrets ([registries]) — выбор вверху и ?reg= в адресе
+REGISTRIES = registry_ids()
+if "f_registry" not in st.session_state and st.query_params.get("reg") in REGISTRIES:
+    st.session_state["f_registry"] = st.query_params.get("reg")
+if len(REGISTRIES) > 1:
+    reg = st.selectbox("🗂️ Реестр", REGISTRIES, format_func=registry_title, key="f_registry")
+else:
+    reg = REGISTRIES[0]
+
+# фильтры, поиск и ссылка на объект прошлого реестра к новому не относятся
+if st.session_state.get("reg_loaded", reg) != reg:
+    for key in ("f_sector", "f_district", "f_status", "f_change", "f_deadline", "f_search", "f_ranked", "f_sort", "f_as_of", "search_recent"):
+        st.session_state.pop(key, None)
+    for param in [p for p in st.query_params if p != "reg"]:
+        del st.query_params[param]
+st.session_state["reg_loaded"] = reg
+if reg == REGISTRIES[0]:
+    st.query_params.pop("reg", None)
+elif st.query_params.get("reg") != reg:
+    st.query_params["reg"] = reg
+# ссылки на объект открывают новую сессию: без reg она показала бы реестр по умолчанию
+REG_QUERY = "" if reg == REGISTRIES[0] else f"reg={quote(reg)}&"
+
+
+def obj_link(key: str) -> str:
+    return f"?{REG_QUERY}obj={quote(key)}"
 
 
-APP_PASSWORD = get_app_password()
+# =============================
+# AUTH
+# =============================
+APP_PASSWORD = registry_setting(reg, "APP_PASSWORD")
 
 if APP_PASSWORD:
+    # вход — отдельно в каждый реестр со своим паролем
     if "auth_ok" not in st.session_state:
-        st.session_state.auth_ok = False
+        st.session_state.auth_ok = set()
 
-    if not st.session_state.auth_ok:
+    if reg not in st.session_state.auth_ok:
         st.markdown("### 🔐 Доступ к реестру")
         st.write("Введите пароль для просмотра данных.")
 
@@ -1029,7 +156,7 @@ if APP_PASSWORD:
 
         if submitted:
             if pwd == APP_PASSWORD:
-                st.session_state.auth_ok = True
+                st.session_state.auth_ok.add(reg)
                 st.success("Доступ разрешён.")
                 st.rerun()
             else:
@@ -1040,20 +167,50 @@ if APP_PASSWORD:
 # =============================
 # LOAD + PREPARE
 # =============================
-raw = load_data()
-if raw.empty:
+snap = get_snapshot(reg)
+if snap is None:
     st.error(
         "Данные не загрузились (реестр пустой). Проверьте CSV_URL в Secrets "
         "или наличие .xlsx в репозитории."
     )
     st.stop()
 
-df = normalize_schema(raw)
-df["search_blob"] = df.apply(build_row_search_blob, axis=1)
+failed = failed_sources(reg)
+if failed:
+    st.warning(
+        f"Не удалось обновить источников: {len(failed)} из {len(source_list(reg))}. "
+        "Для них используется последняя удачная загрузка, если она была."
+    )
 
-sectors = sorted([x for x in df["sector"].unique().tolist() if str(x).strip()])
-districts = sorted([x for x in df["district"].unique().tolist() if str(x).strip()])
-statuses = sorted([x for x in df["status"].unique().tolist() if str(x).strip()])
+# История: реестр на выбранную дату
+as_of_caption = ""
+hdir = history_dir(reg)
+manifest = history_manifest(hdir) if hdir is not None else []
+if len(manifest) > 1:
+    with st.expander("🕓 Реестр на дату"):
+        as_of = st.date_input(
+            "Дата",
+            value=None,
+            min_value=datetime.fromisoformat(manifest[0]["ts"]).date(),
+            max_value=date.today(),
+            format="DD.MM.YYYY",
+            key="f_as_of",
+        )
+    if as_of:
+        entry = history_entry_as_of(manifest, as_of)
+        if entry is None:
+            st.warning("На эту дату снимков реестра нет.")
+        elif entry["seq"] != max(m["seq"] for m in manifest):
+            snap = history_snapshot(reg, str(hdir), entry["seq"])
+            ts = datetime.fromisoformat(entry["ts"])
+            as_of_caption = f" · реестр на {as_of.strftime('%d.%m.%Y')} (снимок от {ts.strftime('%d.%m.%Y %H:%M')})"
+
+df = snap["df"]
+facets = snap["facets"]
+
+sectors = sorted([x for x in facets["sector"] if str(x).strip()])
+districts = sorted([x for x in facets["district"] if str(x).strip()])
+statuses = sorted([x for x in facets["status"] if str(x).strip()])
 
 sectors = move_prochie_to_bottom(sectors)
 
@@ -1061,26 +218,49 @@ sectors = ["Все"] + sectors
 districts = ["Все"] + districts
 statuses = ["Все"] + statuses
 
-# Изменения (фильтр)
-def change_level_to_ru(level: str) -> str:
-    s = norm_col(level)
-    if s in ("major", "важно"):
-        return "Важно"
-    if s in ("minor", "правка"):
-        return "Правка"
-    if s in ("ignore", "без изменений", "нет"):
-        return "—"
-    return "—" if s in ("", "—") else safe_text(level, "—")
+change_items = ["Все"] + sorted([x for x in facets["_change_ru"] if x.strip()], key=lambda z: (z == "—", z))
+
+
+# =============================
+# VIEW <-> URL
+# =============================
+# фильтры живут в адресе страницы: вид можно переслать ссылкой
+URL_PARAMS = {
+    "sector": ("f_sector", sectors),
+    "district": ("f_district", districts),
+    "status": ("f_status", statuses),
+    "change": ("f_change", change_items),
+    "deadline": ("f_deadline", list(DEADLINE_FILTERS)),
+    "q": ("f_search", None),
+    "ranked": ("f_ranked", None),
+    "sort": ("f_sort", list(SORT_OPTIONS)),
+    "tab": ("f_tab", None),
+}
+
+if "url_loaded" not in st.session_state:
+    st.session_state["url_loaded"] = True
+    for param, (key, options) in URL_PARAMS.items():
+        v = st.query_params.get(param)
+        if v is None:
+            continue
+        if key == "f_ranked":
+            st.session_state[key] = v == "1"
+        elif options is None or v in options:
+            st.session_state[key] = v
 
 
-df["_change_ru"] = df["change_level"].apply(change_level_to_ru)
-change_items = ["Все"] + sorted([x for x in df["_change_ru"].unique().tolist() if x.strip()], key=lambda z: (z == "—", z))
+def sync_url(param: str, value: str, default: str) -> None:
+    if value == default:
+        if param in st.query_params:
+            del st.query_params[param]
+    elif st.query_params.get(param) != value:
+        st.query_params[param] = value
 
 
 # =============================
 # FILTERS + SEARCH
 # =============================
-c1, c2, c3, c4, c5 = st.columns([1.0, 1.0, 1.0, 1.0, 1.35])
+c1, c2, c3, c4, c6, c5 = st.columns([1.0, 1.0, 1.0, 1.0, 1.0, 1.35])
 with c1:
     sector_sel = st.selectbox("🏷️ Отрасль", sectors, index=0, key="f_sector")
 with c2:
@@ -1089,37 +269,66 @@ with c3:
     status_sel = st.selectbox("📌 Статус", statuses, index=0, key="f_status")
 with c4:
     change_sel = st.selectbox("⚡ Изменения", change_items, index=0, key="f_change")
+with c6:
+    deadline_sel = st.selectbox("⏳ Сроки", list(DEADLINE_FILTERS), index=0, key="f_deadline")
 with c5:
     q = st.text_input("🔎 Поиск", value="", key="f_search", placeholder="").strip()
+    ranked_on = st.toggle(
+        "🎯 С опечатками, по релевантности",
+        value=False,
+        key="f_ranked",
+        help=f"Нечёткий поиск: лучшие совпадения сверху, показываются первые {RANK_TOP_K}.",
+    )
 
 
 # =============================
 # FILTER APPLY
 # =============================
-filtered = df.copy()
-
-if sector_sel != "Все":
-    filtered = filtered[filtered["sector"].astype(str) == str(sector_sel)]
-if district_sel != "Все":
-    filtered = filtered[filtered["district"].astype(str) == str(district_sel)]
-if status_sel != "Все":
-    filtered = filtered[filtered["status"].astype(str) == str(status_sel)]
-if change_sel != "Все":
-    filtered = filtered[filtered["_change_ru"].astype(str) == str(change_sel)]
-
+for param, value in (
+    ("sector", sector_sel),
+    ("district", district_sel),
+    ("status", status_sel),
+    ("change", change_sel),
+    ("deadline", deadline_sel),
+):
+    sync_url(param, value, "Все")
+sync_url("q", q, "")
+sync_url("ranked", "1" if ranked_on else "", "")
+
+today = date.today()
 qn = norm_search(q)
-if qn:
-    tokens = expand_query_tokens(qn)
-
-    def match_blob(blob: str) -> bool:
-        for t in tokens:
-            if t and t not in blob:
-                return False
-        return True
-
-    filtered = filtered[filtered["search_blob"].apply(match_blob)]
-
-st.caption(f"Показано объектов: {len(filtered)} из {len(df)}")
+view = (sector_sel, district_sel, status_sel, change_sel, deadline_sel, bool(qn and ranked_on), today.isoformat(), qn)
+
+# общий для сессий кеш видов; результаты строгого поиска этой сессии — для уточнения запроса
+recent = st.session_state.setdefault("search_recent", OrderedDict())
+t0 = time.perf_counter()
+found = view_positions(reg, snap["version"], view, snap, recent)
+metric_observe("registry_view_seconds", time.perf_counter() - t0, registry=reg, kind="ranked" if view[5] else "search" if qn else "filter")
+if qn and not ranked_on:
+    remember_view(recent, snap["version"], view, found)
+
+mask = np.zeros(len(df), dtype=bool)
+mask[found] = True
+ranked = found if qn and ranked_on else None
+
+# ссылка на объект (?obj=<ключ строки>): показываем только его
+deep_key = st.query_params.get("obj")
+if deep_key:
+    mask = np.zeros(len(df), dtype=bool)
+    pos = df.index.get_indexer([deep_key])[0]
+    if pos >= 0:
+        mask[pos] = True
+    else:
+        st.info("Объект по ссылке не найден в реестре — возможно, он удалён.")
+    ranked = None
+    st.button("✖️ Показать все объекты", key="deep_link_clear", on_click=lambda: st.query_params.pop("obj", None))
+
+filtered = df[mask]
+# ключ общих кешей по отфильтрованным строкам: ссылка на объект сужает их до одной
+filtered_key = (*view, deep_key or "")
+
+top_caption = f" · по релевантности, первые {RANK_TOP_K}" if ranked is not None and len(ranked) > RANK_TOP_K else ""
+st.caption(f"Показано объектов: {len(filtered)} из {len(df)}{top_caption}{as_of_caption}")
 st.divider()
 
 
@@ -1154,200 +363,371 @@ def change_chip_style(change_ru: str) -> tuple[str, str]:
     return "tag-gray", ""
 
 
-def render_card(row: pd.Series):
-    title_txt = safe_text(row.get("name", "Объект"))
-    title = esc(title_txt)
+def text_html(v) -> str:
+    """Экранированный текст без отступов в начале строк (как после html_clean всей карточки)."""
+    return html_clean(esc(v))
 
-    sector = esc(row.get("sector", "—"))
-    district = esc(row.get("district", "—"))
-    address = esc(row.get("address", "—"))
-    responsible = safe_text(row.get("responsible", ""), "—")
 
-    status = safe_text(row.get("status", ""), "—")
-    work_flag = safe_text(row.get("work_flag", ""), "—")
-    issues = safe_text(row.get("issues", ""), "—")
+def upd_chip_html(v) -> str:
+    upd_txt = date_fmt(v)
+    if upd_txt == "—":
+        return '<span class="tag tag-gray">⏱️ Обновлено: —</span>'
+    return f'<span class="tag tag-green">⏱️ Обновлено: {esc(upd_txt)}</span>'
 
-    accent = status_accent(status)
-    w_col = works_color(work_flag)
 
-    s_cls = tag_class(accent)
-    w_cls = tag_class(w_col)
-
-    card_url = ensure_url(row.get("card_url_text", ""))
-    photo_src = drive_image_url(row.get("photo_url", ""))
-
-    # изменения
-    upd_txt = date_fmt(row.get("card_updated_at", ""))
-    change_ru = safe_text(row.get("_change_ru", "—"), "—")
-    chg_tag_cls, chg_extra_cls = change_chip_style(change_ru)
+def photo_html(v) -> str:
+    photo_src = drive_image_url(v)
+    if not photo_src:
+        return ""
+    return html_clean(
+        f"""
+<div class="photo-wrap">
+  <img class="photo" src="{esc(photo_src)}" alt="Фото объекта" loading="lazy">
+</div>
+"""
+    )
 
-    change_what_ru = translate_change_what(row.get("change_what", ""))
-    change_note = safe_text(row.get("change_note", ""), "—")
 
-    btn_html = html_clean(
+def btn_html(v) -> str:
+    card_url = ensure_url(v)
+    return html_clean(
         f'<a class="a-btn" href="{esc(card_url)}" target="_blank" rel="noopener noreferrer">📄 Открыть карточку</a>'
         if card_url
         else '<span class="a-btn disabled">📄 Открыть карточку</span>'
     )
 
-    photo_html = ""
-    if photo_src:
-        photo_html = html_clean(
-            f"""
-<div class="photo-wrap">
-  <img class="photo" src="{esc(photo_src)}" alt="Фото объекта" loading="lazy">
-</div>
-"""
-        )
 
-    issues_html = html_clean(
+def issues_html(v) -> str:
+    issues = safe_text(v, "—")
+    return html_clean(
         f'<div class="issue-box">{esc(issues)}</div>'
         if issues != "—"
         else '<div class="row"><span class="muted">—</span></div>'
     )
 
-    passport_blocks = []
-    passport_blocks.append(section_html("⚠️ Проблемные вопросы", issues_html, wide=True))
-
-    prog = (
-        kv_html("ГП/СП", row.get("state_program", "—"))
-        + kv_html("ФП", row.get("federal_project", "—"))
-        + kv_html("РП", row.get("regional_program", "—"))
-    )
-    passport_blocks.append(section_html("🏛️ Программы", prog))
-
-    agr = (
-        kv_html("№", row.get("agreement", "—"))
-        + kv_html("Дата", date_fmt(row.get("agreement_date", "")))
-        + kv_html("Сумма", money_fmt(row.get("agreement_amount", "")))
-    )
-    passport_blocks.append(section_html("🧾 Соглашение", agr))
 
-    params = (
-        kv_html("Мощность", row.get("capacity_seats", "—"))
-        + kv_html("Площадь", row.get("area_m2", "—"))
-        + kv_html("Целевой срок", date_fmt(row.get("target_deadline", "")))
-    )
-    passport_blocks.append(section_html("📦 Параметры", params))
-
-    psd = (
-        kv_html("ПСД", row.get("design", "—"))
-        + kv_html("Стоимость ПСД", money_fmt(row.get("psd_cost", "")))
-        + kv_html("Проектировщик", row.get("designer", "—"))
-        + kv_html("Экспертиза", row.get("expertise", "—"))
-        + kv_html("Дата экспертизы", date_fmt(row.get("expertise_date", "")))
-        + kv_html("Заключение", row.get("expertise_conclusion", "—"))
-    )
-    passport_blocks.append(section_html("🗂️ ПСД / Экспертиза", psd))
-
-    rns_block = (
-        kv_html("№ РНС", row.get("rns", "—"))
-        + kv_html("Дата", date_fmt(row.get("rns_date", "")))
-        + kv_html("Срок действия", date_fmt(row.get("rns_expiry", "")))
-    )
-    passport_blocks.append(section_html("🏗️ РНС", rns_block))
-
-    contr = (
-        kv_html("№", row.get("contract", "—"))
-        + kv_html("Дата", date_fmt(row.get("contract_date", "")))
-        + kv_html("Подрядчик", row.get("contractor", "—"))
-        + kv_html("Цена", money_fmt(row.get("contract_price", "")))
-    )
-    passport_blocks.append(section_html("🧩 Контракт", contr))
-
-    terms = (
-        kv_html("Окончание (план)", date_fmt(row.get("end_date_plan", "")))
-        + kv_html("Окончание (факт)", date_fmt(row.get("end_date_fact", "")))
-        + kv_html("Готовность", readiness_fmt(row.get("readiness", "")))
-        + kv_html("Оплачено", money_fmt(row.get("paid", "")))
-    )
-    passport_blocks.append(section_html("⏳ Сроки / финансы", terms))
-
-    rid = safe_text(row.get("id", ""), fallback="").strip()
-    if not rid:
-        rid = f"row_{abs(hash(title_txt))}"
-    rid = re.sub(r"[^a-zA-Z0-9_]+", "_", rid)
-
-    passport_id = f"passport_{rid}"
-    chg_id = f"chg_{rid}"
-
-    passport_html = html_clean(
-        f"""
+def kv(label: str, fmt=None):
+    """Строка паспорта "label: значение" как функция значения колонки."""
+    return lambda v: kv_html(label, fmt(v) if fmt else v)
+
+
+# поле шаблона -> (колонка, функция значения); считается по уникальным значениям
+# колонки один раз на снимок (registry.display_projection)
+CARD_SPEC = {
+    "rid": ("_key", dom_id),
+    "href": ("_key", quote),
+    "title": ("name", text_html),
+    "sector": ("sector", text_html),
+    "district": ("district", text_html),
+    "address": ("address", text_html),
+    "responsible": ("responsible", text_html),
+    "status": ("status", text_html),
+    "accent": ("status", lambda v: esc(status_accent(safe_text(v)))),
+    "s_cls": ("status", lambda v: tag_class(status_accent(safe_text(v)))),
+    "work_flag": ("work_flag", text_html),
+    "w_cls": ("work_flag", lambda v: tag_class(works_color(safe_text(v)))),
+    "btn": ("card_url_text", btn_html),
+    "photo": ("photo_url", photo_html),
+    "upd_chip": ("card_updated_at", upd_chip_html),
+    "change_ru": ("_change_ru", text_html),
+    "chg_cls": ("_change_ru", lambda v: " ".join(change_chip_style(safe_text(v)))),
+    "change_what": ("change_what", lambda v: text_html(translate_change_what(v))),
+    "change_note": ("change_note", text_html),
+    # паспорт
+    "issues": ("issues", issues_html),
+    "kv_state_program": ("state_program", kv("ГП/СП")),
+    "kv_federal_project": ("federal_project", kv("ФП")),
+    "kv_regional_program": ("regional_program", kv("РП")),
+    "kv_agreement": ("agreement", kv("№")),
+    "kv_agreement_date": ("agreement_date", kv("Дата", date_fmt)),
+    "kv_agreement_amount": ("agreement_amount", kv("Сумма", money_fmt)),
+    "kv_capacity_seats": ("capacity_seats", kv("Мощность")),
+    "kv_area_m2": ("area_m2", kv("Площадь")),
+    "kv_target_deadline": ("target_deadline", kv("Целевой срок", date_fmt)),
+    "kv_design": ("design", kv("ПСД")),
+    "kv_psd_cost": ("psd_cost", kv("Стоимость ПСД", money_fmt)),
+    "kv_designer": ("designer", kv("Проектировщик")),
+    "kv_expertise": ("expertise", kv("Экспертиза")),
+    "kv_expertise_date": ("expertise_date", kv("Дата экспертизы", date_fmt)),
+    "kv_expertise_conclusion": ("expertise_conclusion", kv("Заключение")),
+    "kv_rns": ("rns", kv("№ РНС")),
+    "kv_rns_date": ("rns_date", kv("Дата", date_fmt)),
+    "kv_rns_expiry": ("rns_expiry", kv("Срок действия", date_fmt)),
+    "kv_contract": ("contract", kv("№")),
+    "kv_contract_date": ("contract_date", kv("Дата", date_fmt)),
+    "kv_contractor": ("contractor", kv("Подрядчик")),
+    "kv_contract_price": ("contract_price", kv("Цена", money_fmt)),
+    "kv_end_date_plan": ("end_date_plan", kv("Окончание (план)", date_fmt)),
+    "kv_end_date_fact": ("end_date_fact", kv("Окончание (факт)", date_fmt)),
+    "kv_readiness": ("readiness", kv("Готовность", readiness_fmt)),
+    "kv_paid": ("paid", kv("Оплачено", money_fmt)),
+}
+# для колонок, которых нет в источнике (или строки нет в паспорте)
+CARD_DEFAULTS = {f: fn(None) for f, (col, fn) in CARD_SPEC.items() if col != "_key"}
+
+PASSPORT_TEMPLATE = html_clean(
+    f"""
 <div class="passport">
-  <input class="passport-toggle" type="checkbox" id="{passport_id}">
-  <label class="passport-summary" for="{passport_id}">📋 Паспорт объекта и контрольные показатели</label>
+  <input class="passport-toggle" type="checkbox" id="passport_{{rid}}">
+  <label class="passport-summary" for="passport_{{rid}}">📋 Паспорт объекта и контрольные показатели</label>
   <div class="passport-body">
     <div class="passport-grid">
-      {''.join(passport_blocks)}
+      {section_html("⚠️ Проблемные вопросы", "{issues}", wide=True)}{section_html("🏛️ Программы", "{kv_state_program}{kv_federal_project}{kv_regional_program}")}{section_html("🧾 Соглашение", "{kv_agreement}{kv_agreement_date}{kv_agreement_amount}")}{section_html("📦 Параметры", "{kv_capacity_seats}{kv_area_m2}{kv_target_deadline}")}{section_html("🗂️ ПСД / Экспертиза", "{kv_design}{kv_psd_cost}{kv_designer}{kv_expertise}{kv_expertise_date}{kv_expertise_conclusion}")}{section_html("🏗️ РНС", "{kv_rns}{kv_rns_date}{kv_rns_expiry}")}{section_html("🧩 Контракт", "{kv_contract}{kv_contract_date}{kv_contractor}{kv_contract_price}")}{section_html("⏳ Сроки / финансы", "{kv_end_date_plan}{kv_end_date_fact}{kv_readiness}{kv_paid}")}
     </div>
   </div>
   <div class="passport-close">
-    <label class="passport-close-btn" for="{passport_id}" title="Свернуть">▴</label>
+    <label class="passport-close-btn" for="passport_{{rid}}" title="Свернуть">▴</label>
   </div>
 </div>
 """
-    )
-
-    # правая колонка: ответственный + (в строку) обновлено + изменение (кликабельно)
-    upd_chip = f'<span class="tag tag-green">⏱️ Обновлено: {esc(upd_txt)}</span>' if upd_txt != "—" else '<span class="tag tag-gray">⏱️ Обновлено: —</span>'
-
-    # кликабельный чип изменения
-    change_chip = html_clean(
-        f"""
-<input class="chg-toggle" type="checkbox" id="{chg_id}">
-<label class="tag chg-chip {chg_tag_cls} {chg_extra_cls}" for="{chg_id}">⚡ Изменение: {esc(change_ru)}</label>
-<div class="chg-body">
-  <div class="row"><b>Что изменили:</b> {esc(change_what_ru)}</div>
-  <div class="row"><b>Комментарий:</b> {esc(change_note)}</div>
-</div>
-"""
-    )
-
-    right_html = html_clean(
-        f"""
-<div class="right-stack">
-  <span class="resp-chip"><span class="muted">👤 Ответственный:</span> {esc(responsible)}</span>
-  <div class="right-row">
-    {upd_chip}
-    {change_chip}
-  </div>
-</div>
-"""
-    )
+)
 
-    card_html = html_clean(
-        f"""
-<div class="card" data-accent="{esc(accent)}">
-  <div class="card-title">{title}</div>
+CARD_TEMPLATE = html_clean(
+    """
+<div class="card" id="obj_{rid}" data-accent="{accent}">
+  <div class="card-title">{title}<a class="deep-link" href="?{reg_query}obj={href}" target="_self" title="Ссылка на объект">🔗</a></div>
 
   <div class="card-subchips">
     <span class="chip">🏷️ {sector}</span>
     <span class="chip">📍 {district}</span>
   </div>
 
-  {photo_html}
+  {photo}
 
   <div class="addr-row">🗺️ <b>Адрес:</b> {address}</div>
 
   <div class="tags-row">
     <div class="tags-left">
-      <span class="tag {s_cls}">📌 Статус: {esc(status)}</span>
-      <span class="tag {w_cls}">🛠️ Работы: {esc(work_flag)}</span>
+      <span class="tag {s_cls}">📌 Статус: {status}</span>
+      <span class="tag {w_cls}">🛠️ Работы: {work_flag}</span>
+    </div>
+    <div class="right-stack">
+      <span class="resp-chip"><span class="muted">👤 Ответственный:</span> {responsible}</span>
+      <div class="right-row">
+        {upd_chip}
+        <input class="chg-toggle" type="checkbox" id="chg_{rid}">
+        <label class="tag chg-chip {chg_cls}" for="chg_{rid}">⚡ Изменение: {change_ru}</label>
+        <div class="chg-body">
+          <div class="row"><b>Что изменили:</b> {change_what}</div>
+          <div class="row"><b>Комментарий:</b> {change_note}</div>
+        </div>
+      </div>
     </div>
-    {right_html}
   </div>
 
-  {btn_html}
-  {passport_html}
+  {btn}
+  {passport}
 </div>
 """
-    )
+)
 
-    st.markdown(card_html, unsafe_allow_html=True)
+
+# карточек в первом экране (по одной) и в каждой следующей пачке (одним элементом)
+FIRST_SCREEN = 12
+CARD_BATCH = 100
+
+
+def card_html(values: dict, passport: bool = False) -> str:
+    """Карточка из готовых строк проекции; паспорт — только если переданы его поля."""
+    return CARD_TEMPLATE.format_map(
+        {
+            **values,
+            "reg_query": esc(REG_QUERY) if REG_QUERY else "",
+            "passport": PASSPORT_TEMPLATE.format_map(values) if passport else "",
+        }
+    )
 
 
 # =============================
 # OUTPUT
 # =============================
-for _, r in filtered.iterrows():
-    render_card(r)
+# st.tabs выполнял бы все вкладки на каждый перезапуск (поиск, фильтр, сортировку);
+# считаем только открытый раздел, раздел — в ?tab=
+TABS = {"list": "📋 Объекты", "dash": "📊 Сводка", "risk": "⏳ Сроки", "quality": "🩺 Качество данных", "dups": "🧬 Дубли"}
+if st.session_state.get("f_tab") not in TABS:
+    st.session_state["f_tab"] = "list"
+tab = st.radio("Раздел", list(TABS), format_func=TABS.get, horizontal=True, key="f_tab", label_visibility="collapsed")
+sync_url("tab", tab, "list")
+
+if tab == "list":
+    # паспорта есть только у текущего снимка: история хранит основную группу полей
+    live = not as_of_caption
+    s1, s2, s3 = st.columns([1.0, 1.0, 1.0])
+    with s1:
+        sort_sel = st.selectbox(
+            "↕️ Сортировка", list(SORT_OPTIONS), index=0, key="f_sort", disabled=ranked is not None
+        )
+        sync_url("sort", sort_sel, next(iter(SORT_OPTIONS)))
+    with s2:
+        show_passport = st.toggle("📋 Паспорта объектов", value=False, key="f_passport", disabled=not live)
+    with s3:
+        if live:
+            st.download_button(
+                "⬇️ Выгрузить CSV",
+                data=lambda: export_frame(
+                    filtered, passport_frame(reg, snap["version"], tuple(snap["columns"]))
+                ).to_csv(index=False).encode("utf-8-sig"),
+                file_name=f"reestr_{date.today().strftime('%Y-%m-%d')}.csv",
+                mime="text/csv",
+            )
+    if ranked is not None:
+        show = ranked[:RANK_TOP_K]
+    else:
+        show = sorted_positions(snap["sort_perms"], mask, sort_sel)
+
+    view_main = display_projection(reg, snap["version"], "main", df, CARD_SPEC)
+    passports = passport_frame(reg, snap["version"], tuple(snap["columns"])) if live and show_passport else None
+    if passports is not None:
+        view_passport = display_projection(reg, snap["version"], "passport", passports, CARD_SPEC)
+        ppos = passports.index.get_indexer(df.index[show])
+        phash = passports["_phash"].to_numpy()
+
+    # HTML карточки зависит от ключа и содержимого строки -> кеш по (ключ, хеш строки)
+    # (с паспортом — ещё и по хешу паспортной части); переживает смену версии снимка
+    hashes = df["_hash"].to_numpy()
+    show_keys = df.index[show].tolist()
+
+    def cards_for(lo: int, hi: int) -> list[str]:
+        out = []
+        for i in range(lo, min(hi, len(show))):
+            p, key = show[i], show_keys[i]
+            ck = (key, int(hashes[p]))
+            if passports is not None:
+                ck = (key, int(hashes[p]), int(phash[ppos[i]]) if ppos[i] >= 0 else 0)
+            out_html = cache_get(reg, "cards", ck)
+            if out_html is None:
+                values = {**CARD_DEFAULTS, **{f: a[p] for f, a in view_main.items()}}
+                if passports is not None and ppos[i] >= 0:
+                    values.update({f: a[ppos[i]] for f, a in view_passport.items()})
+                out_html = cache_put(reg, "cards", ck, card_html(values, passports is not None))
+            out.append(out_html)
+        return out
+
+    # первый экран уходит сразу, остальное — пачками в заранее поставленные места;
+    # каждый st.* — точка, где Streamlit прерывает прогон, если фильтр уже сменили
+    sent = 0
+    for out_html in cards_for(0, FIRST_SCREEN):
+        st.markdown(out_html, unsafe_allow_html=True)
+        sent += len(out_html.encode())
+    starts = range(FIRST_SCREEN, len(show), CARD_BATCH)
+    slots = [st.empty() for _ in starts]
+    for slot, lo in zip(slots, starts):
+        batch_html = "\n\n".join(cards_for(lo, lo + CARD_BATCH))
+        slot.markdown(batch_html, unsafe_allow_html=True)
+        sent += len(batch_html.encode())
+    metric_observe("registry_rendered_bytes", sent, registry=reg)
+
+if tab == "dash":
+    tables = dashboard_tables(
+        reg, snap["version"], filtered_key, filtered
+    )
+    money_cfg = st.column_config.NumberColumn(format="%.0f")
+    pct_cfg = st.column_config.NumberColumn(format="%.1f")
+    dash_cfg = {
+        "Цена контрактов, ₽": money_cfg,
+        "Оплачено, ₽": money_cfg,
+        "Ср. готовность, %": pct_cfg,
+        "Без работ, %": pct_cfg,
+    }
+    st.markdown("#### 📍 По районам")
+    st.dataframe(tables["district"], width="stretch", column_config=dash_cfg)
+    st.markdown("#### 🏷️ По отраслям")
+    st.dataframe(tables["sector"], width="stretch", column_config=dash_cfg)
+    with st.expander("🧮 Память снимка по колонкам"):
+        mem = snapshot_memory(reg, snap["version"], df)
+        total = mem.iloc[-1]
+        st.caption(
+            f"{total['Байт'] / 2**20:.1f} МБ, объектами Python было бы {total['Байт (object)'] / 2**20:.1f} МБ"
+        )
+        st.dataframe(mem, width="stretch", hide_index=True)
+    with st.expander("🗄️ Кеши"):
+        caches = cache_report(reg)
+        st.caption(
+            f"Занято {caches.attrs['used'] / 2**20:.1f} МБ из {caches.attrs['budget'] / 2**20:.0f} МБ; "
+            "давно не нужное вытесняется, прошлая версия снимка снимается целиком"
+        )
+        st.dataframe(caches, width="stretch", hide_index=True)
+
+if tab == "risk":
+    r1, r2 = st.columns([3.0, 1.0])
+    with r1:
+        horizon = st.slider("Горизонт, дней", min_value=7, max_value=180, value=30, step=1, key="risk_horizon")
+    with r2:
+        overdue = st.checkbox("С просроченными", value=True, key="risk_overdue")
+    risks = risk_report(reg, snap["version"], filtered_key, horizon, overdue, today.isoformat(), snap, mask)
+    st.caption(f"Сроков в окне: {len(risks)}")
+    st.dataframe(
+        risks,
+        width="stretch",
+        hide_index=True,
+        column_config={"Дата": st.column_config.DateColumn(format="DD.MM.YYYY")},
+    )
+
+if tab == "quality":
+    report = quality_report(reg, snap["version"], filtered_key, today.isoformat(), filtered)
+    total = report["district"].iloc[-1]
+    st.caption(f"С замечаниями: {total['С замечаниями']} из {total['Объектов']}")
+    st.markdown("#### 👤 По ответственным")
+    st.dataframe(report["responsible"], width="stretch")
+    st.markdown("#### 📍 По районам")
+    st.dataframe(report["district"], width="stretch")
+
+    st.markdown("#### 🔎 Объекты")
+    check = st.selectbox("Замечание", ["Все"] + list(QUALITY_CHECKS.values()), key="q_check")
+    objects = report["objects"]
+    if check != "Все":
+        objects = objects[objects["Замечания"].str.contains(check, regex=False)]
+    st.dataframe(
+        objects.assign(Ссылка=[obj_link(k) for k in objects["_key"]]).drop(columns="_key"),
+        width="stretch",
+        hide_index=True,
+        column_config={
+            "Дней без обновления": st.column_config.NumberColumn(format="%d"),
+            "Ссылка": st.column_config.LinkColumn(display_text="🔗"),
+        },
+    )
+
+if tab == "dups":
+    # для администраторов реестра: с ADMIN_PASSWORD в Secrets — отдельный вход
+    ADMIN_PASSWORD = registry_setting(reg, "ADMIN_PASSWORD")
+    if "admin_ok" not in st.session_state:
+        st.session_state.admin_ok = set()
+    if ADMIN_PASSWORD and reg not in st.session_state.admin_ok:
+        with st.form("admin_form", clear_on_submit=False):
+            admin_pwd = st.text_input("Пароль администратора", type="password", placeholder="")
+            admin_submitted = st.form_submit_button("Войти")
+        if admin_submitted:
+            if admin_pwd == ADMIN_PASSWORD:
+                st.session_state.admin_ok.add(reg)
+                st.rerun()
+            else:
+                st.error("Неверный пароль.")
+    else:
+        # поиск дублей — только в открытом разделе, раз на версию снимка;
+        # под serve.py он уже посчитан фоновым потоком после обновления
+        with st.spinner("Ищем дубли — один раз на версию реестра…"):
+            dups = duplicate_report(reg, snap["version"], df)
+        # пара показывается, если под фильтры попал хотя бы один из объектов
+        shown = dups[dups["_key1"].isin(filtered.index) | dups["_key2"].isin(filtered.index)]
+        st.caption(
+            f"Подозрений на дубли: {len(shown)} · сравнено пар: {dups.attrs['candidates']} "
+            f"в {dups.attrs['blocks']} группах «район + тип» из {dups.attrs['rows']} объектов "
+            f"за {dups.attrs['seconds']:.1f} с"
+        )
+        st.dataframe(
+            shown.assign(
+                **{
+                    "Ссылка 1": [obj_link(k) for k in shown["_key1"]],
+                    "Ссылка 2": [obj_link(k) for k in shown["_key2"]],
+                }
+            ).drop(columns=["_key1", "_key2"]),
+            width="stretch",
+            hide_index=True,
+            column_config={
+                "Сходство, %": st.column_config.NumberColumn(format="%d"),
+                "Ссылка 1": st.column_config.LinkColumn(display_text="🔗"),
+                "Ссылка 2": st.column_config.LinkColumn(display_text="🔗"),
+            },
+        )
+
+metric_observe("registry_rerun_seconds", time.perf_counter() - run_t0, registry=reg)
@@ -0,0 +1,133 @@
+"""
+Сравнение чтения .xlsx: pd.read_excel против потокового read_xlsx.
+
+    python bench_xlsx.py --rows 5000
+
+Собирает книгу со схемой реестра, как её ведут вручную: оформление каждой
+ячейки, скрытый служебный лист, «хвост» оформленных пустых строк под
+таблицей. Читаем все колонки (паспорт, выгрузка) и только MAIN_FIELDS
+(снимок), как это делает приложение. Каждый способ чтения запускается в отдельном процессе, чтобы
+пиковая память (VmHWM из /proc, т. е. только Linux) не смешивалась. Печатает время, прирост
+пиковой памяти и совпадение результата после normalize_schema.
+"""
+import argparse
+import csv
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+READERS = ["read_excel", "openpyxl", "calamine"]
+
+
+def build_workbook(rows: int, path: Path, tail: int) -> None:
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+    from loadtest import synthetic_registry
+
+    data = list(csv.reader(io.StringIO(synthetic_registry(rows))))
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Реестр"
+    side = Side(style="thin")
+    border = Border(left=side, right=side, top=side, bottom=side)
+    fill = PatternFill("solid", fgColor="DDEBF7")
+    wrap = Alignment(wrap_text=True, vertical="top")
+    for r, row in enumerate(data, start=1):
+        for c, v in enumerate(row, start=1):
+            # суммы и количества — числовые ячейки, как в живой книге
+            cell = ws.cell(r, c, int(v) if r > 1 and v.isdigit() else v or None)
+            cell.border = border
+            cell.alignment = wrap
+            if r == 1:
+                cell.font = Font(bold=True)
+                cell.fill = fill
+    # оформленные пустые строки под таблицей — «на вырост»
+    for r in range(len(data) + 1, len(data) + 1 + tail):
+        for c in range(1, len(data[0]) + 1):
+            ws.cell(r, c).border = border
+    hidden = wb.create_sheet("Справочники")
+    hidden.sheet_state = "hidden"
+    for r in range(1, rows + 1):
+        hidden.append([f"Справочник {r}", r, r * 1.5])
+    wb.save(path)
+
+
+def proc_kb(field: str) -> int:
+    status = Path("/proc/self/status").read_text()
+    return int(next(line.split()[1] for line in status.splitlines() if line.startswith(field)))
+
+
+def child(reader: str, path: Path, out: Path, projected: bool) -> None:
+    """Один замер в чистом процессе; результат — в out (JSON + parquet)."""
+    from streamlit.logger import set_log_level
+
+    set_log_level("error")
+    import pandas as pd
+
+    import registry
+
+    data = path.read_bytes()
+    fields = registry.MAIN_FIELDS if projected else None
+    Path("/proc/self/clear_refs").write_text("5")  # сброс пика (VmHWM) к текущему RSS
+    base = proc_kb("VmRSS")
+    t0 = time.perf_counter()
+    if reader == "read_excel":
+        # прежний путь read_projected: заголовок, затем usecols
+        header = pd.read_excel(io.BytesIO(data), sheet_name=0, nrows=0).columns
+        wanted = registry.source_columns(list(header), fields)
+        usecols = None if wanted is None else (lambda c: str(c).strip() in wanted)
+        df = pd.read_excel(io.BytesIO(data), sheet_name=0, usecols=usecols)
+    else:
+        if reader == "openpyxl":
+            registry.CalamineWorkbook = None
+        df = registry.read_xlsx(data, fields)
+    seconds = time.perf_counter() - t0
+    peak = proc_kb("VmHWM")
+    df = registry.normalize_schema(df, fields).astype(str)
+    df.to_parquet(out.with_suffix(".parquet"))
+    out.write_text(json.dumps({"seconds": seconds, "peak_mb": (peak - base) / 1024, "rows": len(df)}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="read_excel против потокового чтения .xlsx")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--tail", type=int, default=2000, help="оформленных пустых строк под таблицей")
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        reader, book, out, projected = args.child
+        child(reader, Path(book), Path(out), projected == "1")
+        return
+
+    import pandas as pd
+
+    import registry
+
+    readers = [r for r in READERS if r != "calamine" or registry.CalamineWorkbook is not None]
+    with tempfile.TemporaryDirectory() as tmp:
+        book = Path(tmp) / "registry.xlsx"
+        build_workbook(args.rows, book, args.tail)
+        print(f"книга: {args.rows} строк, {book.stat().st_size / 1e6:.1f} МБ")
+        results, frames = {}, {}
+        for projected in ("0", "1"):
+            for reader in readers:
+                out = Path(tmp) / f"{reader}-{projected}.json"
+                cmd = [sys.executable, __file__, "--child", reader, str(book), str(out), projected]
+                subprocess.run(cmd, check=True)
+                results[reader, projected] = json.loads(out.read_text())
+                frames[reader, projected] = pd.read_parquet(out.with_suffix(".parquet"))
+
+    print(f"{'способ':<12}{'поля':<10}{'с':>8}{'МБ пик':>10}{'строк':>8}  совпадает")
+    for (reader, projected), r in results.items():
+        same = frames[reader, projected].equals(frames["read_excel", projected])
+        label = "основные" if projected == "1" else "все"
+        print(f"{reader:<12}{label:<10}{r['seconds']:>8.2f}{r['peak_mb']:>10.1f}{r['rows']:>8}  {'да' if same else 'нет'}")
+
+
+if __name__ == "__main__":
+    main()
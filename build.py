@@ -0,0 +1,45 @@
+"""
+Сборка реестра заранее, без Streamlit-сервера:
+
+    python build.py /srv/registry-artifacts
+    python build.py /srv/registry-artifacts --source https://.../export?format=csv --source sport.xlsx
+    python build.py /srv/registry-artifacts/kursk-2025 --registry kursk-2025
+
+Загружает источники (по умолчанию CSV_URL реестра из .streamlit/secrets.toml),
+приводит схему, строит снимок с фасетами, сортировками и индексом дат,
+поисковый индекс и паспорт и пишет всё в ARTIFACT_DIR/<version>/. Приложение
+с ARTIFACT_DIR в Secrets при старте только отображает эти файлы (у реестра
+из [registries] это ARTIFACT_DIR/<id>, если свой каталог не задан).
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from streamlit.logger import set_log_level
+
+# без сервера st.cache_* пишут предупреждения про отсутствие ScriptRunContext
+set_log_level("error")
+
+from registry import ARTIFACT_KEEP, DEFAULT_REGISTRY, build_artifact  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Собрать артефакт реестра для приложения")
+    parser.add_argument("out", type=Path, help="каталог артефактов (ARTIFACT_DIR)")
+    parser.add_argument("--source", action="append", default=None, help="CSV-ссылка или путь к .xlsx; по умолчанию CSV_URL")
+    parser.add_argument("--keep", type=int, default=ARTIFACT_KEEP, help="сколько версий хранить")
+    parser.add_argument("--registry", default=DEFAULT_REGISTRY, help="id реестра из [registries] в Secrets")
+    args = parser.parse_args()
+
+    try:
+        manifest = build_artifact(args.registry, args.out, tuple(args.source) if args.source else None, max(args.keep, 1))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(manifest, ensure_ascii=False, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""
+Нагрузочный тест: сколько одновременных сессий выдерживает один процесс.
+
+    python loadtest.py --sessions 20 --duration 60 --rows 5000
+
+Собирает синтетический реестр и отдаёт его по HTTP локальной заглушкой
+вместо опубликованной таблицы (CSV_URL), запускает `streamlit run app.py`
+с отдельными Secrets и подключает N сессий по websocket-протоколу
+Streamlit — так же, как браузер. Каждая сессия проходит сценарии из смеси
+(фильтры, поиск по мере набора, ранжированный поиск, сортировка) с паузами
+«на подумать». В конце — p50/p95/p99 времени перезапуска скрипта по типам
+шагов и времени до первой карточки, CPU и память сервера в пересчёте на
+сессию (CPU/RSS читаются из /proc, т. е. только Linux).
+
+Нужен пакет websockets (есть в uvicorn[standard]); в requirements.txt его нет —
+приложению он не нужен.
+"""
+import argparse
+import asyncio
+import csv
+import http.server
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+try:
+    import websockets
+except Exception:
+    websockets = None
+
+
+# =============================
+# SCENARIO MIX
+# =============================
+# Сценарий — шаги (ключ виджета, значение); None возвращает виджет к значению по умолчанию.
+# Свой смешанный набор (записанный с реальных сессий) — JSON того же вида: --mix file.json
+MIX = [
+    [("f_district", "Курский"), ("f_status", "Строительство"), ("f_status", None), ("f_district", None)],
+    [
+        ("f_search", "ш"),
+        ("f_search", "шк"),
+        ("f_search", "школ"),
+        ("f_search", "школа"),
+        ("f_search", "школа курск"),
+        ("f_search", "школа курский"),
+        ("f_search", None),
+    ],
+    [
+        ("f_sector", "Образование"),
+        ("f_sort", "Готовность ↓"),
+        ("f_sort", "Наименование А→Я"),
+        ("f_sort", None),
+        ("f_sector", None),
+    ],
+    [
+        ("f_ranked", True),
+        ("f_search", "фельдшерскй пункт"),
+        ("f_search", "фельдшерскй пункт льгов"),
+        ("f_search", None),
+        ("f_ranked", None),
+    ],
+    [("f_deadline", "Срок РНС: ≤ 90 дн."), ("f_district", "Льговский"), ("f_district", None), ("f_deadline", None)],
+]
+
+
+# =============================
+# SYNTHETIC REGISTRY
+# =============================
+SECTORS = ["Образование", "Здравоохранение", "Культура", "Спорт", "Прочие"]
+DISTRICTS = ["Курский", "Льговский", "Суджанский", "Рыльский", "Глушковский", "г. Курск"]
+STATUSES = ["Строительство", "Проектирование", "Приостановлено", "Завершено"]
+NAMES = [
+    "Средняя общеобразовательная школа №{}",
+    "ФАП с. Ивановка {}",
+    "Дом культуры {}",
+    "Физкультурно-оздоровительный комплекс {}",
+    "Детский сад {}",
+    "Центральная районная больница {}",
+]
+COLUMNS = [
+    "id", "sector", "district", "name", "object_type", "address", "responsible", "status",
+    "works_in_progress", "issues", "updated_at", "card_url", "photo_url", "card_updated_at",
+    "change_level", "change_what", "change_note", "state_program", "federal_project",
+    "regional_program", "agreement", "agreement_date", "agreement_amount", "capacity_seats",
+    "area_m2", "target_deadline", "design", "psd_cost", "designer", "expertise",
+    "expertise_conclusion", "expertise_date", "rns", "rns_date", "rns_expiry", "contract",
+    "contract_date", "contractor", "contract_price", "end_date_plan", "end_date_fact",
+    "readiness", "paid",
+]
+
+
+def synthetic_registry(rows: int, seed: int = 1) -> str:
+    """CSV со схемой реестра: те же колонки и форматы (даты дд.мм.гггг, суммы, проценты)."""
+    rnd = random.Random(seed)
+    this_year = time.localtime().tm_year
+
+    def d() -> str:
+        return f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(this_year - 1, this_year + 2)}"
+
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(COLUMNS)
+    for i in range(rows):
+        price = rnd.randint(1, 500) * 100000
+        w.writerow(
+            [
+                f"OBJ-{i:05d}",
+                rnd.choice(SECTORS),
+                rnd.choice(DISTRICTS),
+                rnd.choice(NAMES).format(i),
+                "Объект",
+                f"с. Село{i % 40}, ул. Ленина, {i}",
+                rnd.choice(["Иванов И.И.", "Петров П.П.", "Сидорова А.А."]),
+                rnd.choice(STATUSES),
+                rnd.choice(["да", "нет", "не ведутся"]),
+                rnd.choice(["", "Нет подрядчика", "Сдвиг сроков"]),
+                d(),
+                f"https://example.org/card/{i}",
+                f"https://drive.google.com/file/d/photo{i}/view" if i % 3 else "",
+                d(),
+                rnd.choice(["major", "minor", "ignore", ""]),
+                rnd.choice(["status|paid", "readiness", "contract_price, issues", ""]),
+                rnd.choice(["", "Обновлено"]),
+                "ГП Развитие",
+                "ФП Культура",
+                "РП Курская область",
+                f"A-{i}",
+                d(),
+                str(price * 2),
+                str(rnd.randint(10, 500)),
+                str(rnd.randint(100, 5000)),
+                d(),
+                "да",
+                str(price // 10),
+                rnd.choice(["ООО Проект", "АО Гипрострой"]),
+                "положительное",
+                f"№ {i}-э",
+                d(),
+                f"RNS-{i}" if i % 5 else "",
+                d(),
+                d() if i % 4 else "",
+                f"K-{i}",
+                d(),
+                rnd.choice(["ООО Стройка", "АО Строй", "ИП Иванов"]),
+                str(price) if i % 7 else "",
+                d(),
+                "",
+                rnd.choice(["45%", "75%", "12,5", "100"]) if i % 6 else "",
+                str(price // 2),
+            ]
+        )
+    return buf.getvalue()
+
+
+def serve_file(path: Path) -> tuple[str, http.server.ThreadingHTTPServer]:
+    """Заглушка опубликованной таблицы: отдаёт файл по HTTP на свободном порту."""
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(path.parent), **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, name="csv-stand-in", daemon=True).start()
+    return f"http://127.0.0.1:{srv.server_address[1]}/{path.name}", srv
+
+
+# =============================
+# SERVER PROCESS
+# =============================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port: int, secrets: Path, log: Path) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "streamlit", "run", str(Path(__file__).parent / "app.py"),
+        "--server.port", str(port),
+        "--server.headless", "true",
+        "--browser.gatherUsageStats", "false",
+        "--secrets.files", str(secrets),
+    ]
+    proc = subprocess.Popen(cmd, stdout=log.open("wb"), stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"streamlit завершился с кодом {proc.returncode}, см. {log}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.3)
+    proc.kill()
+    raise RuntimeError(f"сервер не ответил за 60 с, см. {log}")
+
+
+def proc_usage(pid: int) -> tuple[float, int]:
+    """(CPU-секунды user+system, RSS в байтах) процесса из /proc."""
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu, rss
+
+
+# =============================
+# WEBSOCKET SESSION
+# =============================
+def widget_ids(fm: ForwardMsg, ids: dict[str, str]) -> None:
+    """Ключ виджета -> его id на сервере (id с ключом заканчивается на "-<key>")."""
+    if fm.delta.WhichOneof("type") != "new_element":
+        return
+    kind = fm.delta.new_element.WhichOneof("type")
+    wid = getattr(getattr(fm.delta.new_element, kind), "id", "") if kind else ""
+    if wid.startswith("$$ID-"):
+        ids[wid.split("-", 2)[2]] = wid
+
+
+def widget_states(bm: BackMsg, states: dict, ids: dict[str, str]) -> None:
+    for key, value in states.items():
+        if key not in ids:
+            continue
+        w = bm.rerun_script.widget_states.widgets.add()
+        w.id = ids[key]
+        if isinstance(value, bool):
+            w.bool_value = value
+        elif isinstance(value, str):
+            w.string_value = value
+        else:
+            w.double_array_value.data[:] = [float(value)]
+
+
+async def rerun(ws, states: dict, ids: dict[str, str]) -> dict:
+    """Один перезапуск скрипта: как браузер, отправляем все изменённые виджеты."""
+    bm = BackMsg()
+    bm.rerun_script.query_string = ""
+    widget_states(bm, states, ids)
+
+    started = time.perf_counter()
+    await ws.send(bm.SerializeToString())
+    messages, received, errors, first_card = 0, 0, 0, None
+    while True:
+        raw = await ws.recv()
+        fm = ForwardMsg()
+        fm.ParseFromString(raw)
+        messages += 1
+        received += len(raw)
+        kind = fm.WhichOneof("type")
+        if kind == "delta":
+            widget_ids(fm, ids)
+            element = fm.delta.new_element.WhichOneof("type")
+            if element == "exception":
+                errors += 1
+            elif first_card is None and element == "markdown" and 'class="card"' in fm.delta.new_element.markdown.body:
+                first_card = time.perf_counter() - started
+        elif kind == "script_finished":
+            return {
+                "latency": time.perf_counter() - started,
+                "first_card": first_card,
+                "messages": messages,
+                "bytes": received,
+                "errors": errors + int(fm.script_finished != 0),
+            }
+
+
+async def run_session(n: int, url: str, mix: list, until: float, think: float, out: list) -> None:
+    rnd = random.Random(n)
+    async with websockets.connect(url, subprotocols=["streamlit"], max_size=None) as ws:
+        states, ids = {}, {}
+        out.append({"session": n, "step": "open", **await rerun(ws, states, ids)})
+        i = n
+        while time.time() < until:
+            for key, value in mix[i % len(mix)]:
+                await asyncio.sleep(rnd.expovariate(1.0 / think) if think > 0 else 0)
+                if time.time() >= until:
+                    return
+                if value is None:
+                    states.pop(key, None)
+                else:
+                    states[key] = value
+                out.append({"session": n, "step": key, **await rerun(ws, states, ids)})
+            i += 1
+
+
+async def drive(url: str, sessions: int, duration: float, think: float, mix: list, pid: int) -> dict:
+    results, rss_peak = [], 0
+    until = time.time() + duration
+
+    async def sample() -> None:
+        nonlocal rss_peak
+        while time.time() < until:
+            rss_peak = max(rss_peak, proc_usage(pid)[1])
+            await asyncio.sleep(0.5)
+
+    cpu0, _ = proc_usage(pid)
+    t0 = time.time()
+    tasks = [asyncio.create_task(sample())]
+    for n in range(sessions):
+        tasks.append(asyncio.create_task(run_session(n, url, mix, until, think, results)))
+        await asyncio.sleep(0.05)  # сессии открываются не в одну миллисекунду
+    done = await asyncio.gather(*tasks, return_exceptions=True)
+    cpu1, rss_end = proc_usage(pid)
+    return {
+        "results": results,
+        "failed_sessions": [repr(e) for e in done if isinstance(e, Exception)],
+        "cpu_seconds": cpu1 - cpu0,
+        "wall_seconds": time.time() - t0,
+        "rss_peak": max(rss_peak, rss_end),
+    }
+
+
+# =============================
+# REPORT
+# =============================
+def percentiles(values: list[float]) -> dict[str, float]:
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values else (np.nan, np.nan, np.nan)
+    return {"n": len(values), "p50": p50, "p95": p95, "p99": p99}
+
+
+def report(run: dict, sessions: int, rss_base: int) -> dict:
+    res = run["results"]
+    steps = {}
+    for r in res:
+        steps.setdefault(r["step"], []).append(r)
+    by_step = {
+        step: {**percentiles([r["latency"] for r in rs]), "kb": np.mean([r["bytes"] for r in rs]) / 1024}
+        for step, rs in sorted(steps.items())
+    }
+    reruns = [r for r in res if r["step"] != "open"]
+    return {
+        "sessions": sessions,
+        "reruns": len(res),
+        "errors": sum(r["errors"] for r in res),
+        "failed_sessions": run["failed_sessions"],
+        "rerun": percentiles([r["latency"] for r in reruns]),
+        "open": by_step.pop("open", percentiles([])),
+        # время до первой карточки в ответе (шаги, где карточек нет, не считаются)
+        "first_card_open": percentiles([r["first_card"] for r in res if r["step"] == "open" and r["first_card"] is not None]),
+        "first_card": percentiles([r["first_card"] for r in reruns if r["first_card"] is not None]),
+        "by_step": by_step,
+        "reruns_per_s": len(res) / run["wall_seconds"],
+        "cpu_per_session_pct": 100.0 * run["cpu_seconds"] / run["wall_seconds"] / sessions,
+        "mem_per_session_mb": (run["rss_peak"] - rss_base) / sessions / 2**20,
+        "rss_base_mb": rss_base / 2**20,
+        "rss_peak_mb": run["rss_peak"] / 2**20,
+    }
+
+
+def print_report(rep: dict) -> None:
+    def row(name: str, p: dict, kb: float | None = None) -> str:
+        tail = f"{kb:9.0f}" if kb is not None else ""
+        return f"  {name:<14}{p['n']:>7}{p['p50'] * 1000:>9.0f}{p['p95'] * 1000:>9.0f}{p['p99'] * 1000:>9.0f}{tail}"
+
+    print(f"\nСессий: {rep['sessions']}, перезапусков: {rep['reruns']} ({rep['reruns_per_s']:.1f}/с), ошибок: {rep['errors']}")
+    for e in rep["failed_sessions"]:
+        print(f"  сессия упала: {e}")
+    print(f"  {'шаг':<14}{'n':>7}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'КБ':>9}")
+    print(row("открытие", rep["open"], rep["open"].get("kb")))
+    for step, p in rep["by_step"].items():
+        print(row(step, p, p["kb"]))
+    print(row("все шаги", rep["rerun"]))
+    print("  первая карточка:")
+    print(row("открытие", rep["first_card_open"]))
+    print(row("все шаги", rep["first_card"]))
+    print(
+        f"CPU сервера на сессию: {rep['cpu_per_session_pct']:.1f}% ядра; "
+        f"память на сессию: {rep['mem_per_session_mb']:.1f} МБ "
+        f"(RSS {rep['rss_base_mb']:.0f} -> {rep['rss_peak_mb']:.0f} МБ)"
+    )
+
+
+# =============================
+# MAIN
+# =============================
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Нагрузочный тест app.py: N одновременных сессий.")
+    ap.add_argument("--sessions", type=int, default=10, help="одновременных сессий")
+    ap.add_argument("--duration", type=float, default=60, help="секунд нагрузки")
+    ap.add_argument("--rows", type=int, default=5000, help="строк в синтетическом реестре")
+    ap.add_argument("--think", type=float, default=0.5, help="средняя пауза между действиями, с")
+    ap.add_argument("--mix", type=Path, help="JSON со сценариями вместо встроенной смеси")
+    ap.add_argument("--json", type=Path, help="сохранить отчёт в JSON")
+    ap.add_argument("--port", type=int, default=0, help="порт сервера (по умолчанию свободный)")
+    args = ap.parse_args()
+
+    if websockets is None:
+        sys.exit("Нужен пакет websockets: pip install websockets")
+    mix = json.loads(args.mix.read_text(encoding="utf-8")) if args.mix else MIX
+
+    with tempfile.TemporaryDirectory(prefix="registry-loadtest-") as tmp:
+        tmp = Path(tmp)
+        data = tmp / "registry.csv"
+        data.write_text(synthetic_registry(args.rows), encoding="utf-8")
+        csv_url, stand_in = serve_file(data)
+        secrets = tmp / "secrets.toml"
+        secrets.write_text(f'CSV_URL = "{csv_url}"\nHISTORY_DIR = ""\n', encoding="utf-8")
+
+        port = args.port or free_port()
+        proc = start_app(port, secrets, tmp / "server.log")
+        url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        try:
+            # первая сессия прогревает кеши снимка — базовая линия памяти после неё
+            warm = asyncio.run(drive(url, 1, 0, 0, [[]], proc.pid))
+            print(f"Прогрев: {warm['results'][0]['latency']:.1f} с, {args.rows} строк")
+            rss_base = proc_usage(proc.pid)[1]
+            run = asyncio.run(drive(url, args.sessions, args.duration, args.think, mix, proc.pid))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+            stand_in.shutdown()
+
+    rep = report(run, args.sessions, rss_base)
+    print_report(rep)
+    if args.json:
+        args.json.write_text(json.dumps(rep, ensure_ascii=False, indent=2, default=float), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
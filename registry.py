@@ -0,0 +1,2814 @@
+import base64
+import csv
+import functools
+import hashlib
+import html
+import inspect
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+import streamlit as st
+
+try:  # PyICU (необязательно): локальная сортировка кириллицы
+    import icu
+except Exception:
+    icu = None
+
+try:  # python-calamine (необязательно): быстрый разбор .xlsx на Rust
+    from python_calamine import CalamineWorkbook
+except Exception:
+    CalamineWorkbook = None
+
+try:  # блокировка издателя общего снимка (только POSIX)
+    import fcntl
+except Exception:
+    fcntl = None
+
+
+# =============================
+# HELPERS
+# =============================
+def safe_text(v, fallback="—") -> str:
+    if v is None:
+        return fallback
+    try:
+        if pd.isna(v):
+            return fallback
+    except Exception:
+        pass
+    s = str(v).strip()
+    if s.lower() in ("nan", "none", "null", ""):
+        return fallback
+    return s
+
+
+def esc(v) -> str:
+    return html.escape(safe_text(v, fallback="—"))
+
+
+def norm_col(s: str) -> str:
+    if s is None:
+        return ""
+    s = str(s).strip().lower().replace("ё", "е")
+    s = re.sub(r"\s+", " ", s)
+    return s
+
+
+def pick_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
+    cols = {norm_col(c): c for c in df.columns}
+    for cand in candidates:
+        nc = norm_col(cand)
+        if nc in cols:
+            return cols[nc]
+    for cand in candidates:
+        nc = norm_col(cand)
+        if not nc:
+            continue
+        for c in df.columns:
+            if nc in norm_col(c):
+                return c
+    return None
+
+
+def ensure_url(v) -> str:
+    x = safe_text(v, fallback="").strip()
+    if not x or x == "—":
+        return ""
+    if re.match(r"^https?://", x, flags=re.I):
+        return x
+    return ""
+
+
+def read_local_crest_b64() -> str | None:
+    p = Path(__file__).parent / "assets" / "gerb.png"
+    if not p.exists():
+        return None
+    return base64.b64encode(p.read_bytes()).decode("utf-8")
+
+
+def move_prochie_to_bottom(items: list[str]) -> list[str]:
+    if not items:
+        return items
+
+    def is_prochie(x: str) -> bool:
+        nx = norm_col(x)
+        return nx in ("прочие", "прочее")
+
+    prochie = [x for x in items if is_prochie(x)]
+    rest = [x for x in items if not is_prochie(x)]
+    return rest + prochie
+
+
+def status_accent(status_text: str) -> str:
+    s = norm_col(status_text)
+    if "останов" in s or "приостанов" in s:
+        return "red"
+    if "проектир" in s:
+        return "yellow"
+    if "строитель" in s:
+        return "green"
+    return "blue"
+
+
+def works_color(work_flag: str) -> str:
+    s = norm_col(work_flag)
+    if s in ("—", "", "нет", "не ведутся", "не ведутся.", "не ведутся.."):
+        return "red"
+    if "не вед" in s or "не выполня" in s or "отсутств" in s:
+        return "red"
+    if s == "да" or "ведут" in s or "выполня" in s or "идут" in s:
+        return "green"
+    return "gray"
+
+
+def change_level_to_ru(level: str) -> str:
+    s = norm_col(level)
+    if s in ("major", "важно"):
+        return "Важно"
+    if s in ("minor", "правка"):
+        return "Правка"
+    if s in ("ignore", "без изменений", "нет"):
+        return "—"
+    return "—" if s in ("", "—") else safe_text(level, "—")
+
+
+def try_parse_date(v) -> date | None:
+    if v is None:
+        return None
+    try:
+        if pd.isna(v):
+            return None
+    except Exception:
+        pass
+
+    if isinstance(v, date) and not isinstance(v, datetime):
+        return v
+    if isinstance(v, datetime):
+        return v.date()
+
+    s = str(v).strip()
+    if not s or s.lower() in ("nan", "none", "null", "—"):
+        return None
+
+    # serial date (Google/Excel)
+    if re.fullmatch(r"\d+(\.\d+)?", s):
+        try:
+            num = float(s)
+            dt = pd.to_datetime(num, unit="D", origin="1899-12-30", errors="coerce")
+            if pd.isna(dt):
+                return None
+            return dt.date()
+        except Exception:
+            return None
+
+    for fmt in ("%d.%m.%Y", "%d.%m.%y", "%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except Exception:
+            pass
+
+    try:
+        dt = pd.to_datetime(s, errors="coerce", dayfirst=True)
+        if pd.isna(dt):
+            return None
+        return dt.date()
+    except Exception:
+        return None
+
+
+def date_fmt(v) -> str:
+    d = try_parse_date(v)
+    return d.strftime("%d.%m.%Y") if d else "—"
+
+
+# свежесть обновления: до 7 дней — зелёный, до 14 — жёлтый, дальше — красный
+STALE_DAYS = (7, 14)
+
+
+def update_color(updated_at_value) -> tuple[str, str]:
+    d = try_parse_date(updated_at_value)
+    if not d:
+        return "gray", "—"
+    days = (date.today() - d).days
+    if days <= STALE_DAYS[0]:
+        return "green", d.strftime("%d.%m.%Y")
+    if days <= STALE_DAYS[1]:
+        return "yellow", d.strftime("%d.%m.%Y")
+    return "red", d.strftime("%d.%m.%Y")
+
+
+def money_fmt(v) -> str:
+    s = safe_text(v, fallback="—")
+    if s == "—":
+        return s
+    try:
+        x = str(s).replace(" ", "").replace("\u00A0", "").replace(",", ".")
+        x = float(x)
+        return f"{x:,.2f}".replace(",", " ").replace(".00", "") + " ₽"
+    except Exception:
+        return s if ("₽" in s or "руб" in s.lower()) else f"{s} ₽"
+
+
+def readiness_fmt(v) -> str:
+    s = safe_text(v, fallback="—")
+    if s == "—":
+        return "—"
+    s0 = str(s).strip()
+    if not s0:
+        return "—"
+    if "%" in s0:
+        return s0.replace(" ", "")
+
+    try:
+        x = str(s0).replace(" ", "").replace("\u00A0", "").replace(",", ".")
+        x = float(x)
+        p = x * 100 if 0 <= x <= 1 else x
+        if abs(p - round(p)) < 1e-9:
+            return f"{int(round(p))}%"
+        return f"{p:.1f}".replace(".", ",") + "%"
+    except Exception:
+        return s0
+
+
+def parse_money(v) -> float | None:
+    s = safe_text(v, fallback="")
+    if not s:
+        return None
+    x = s.replace(" ", "").replace("\u00A0", "").replace(",", ".")
+    x = re.sub(r"[^\d.\-]", "", x)
+    try:
+        return float(x)
+    except Exception:
+        return None
+
+
+def parse_readiness(v) -> float | None:
+    """Готовность в процентах (0.45 -> 45.0, "75%" -> 75.0)."""
+    s = safe_text(v, fallback="")
+    if not s:
+        return None
+    x = parse_money(s.replace("%", ""))
+    if x is None:
+        return None
+    if "%" in s:
+        return x
+    return x * 100 if 0 <= x <= 1 else x
+
+
+def norm_search(s: str) -> str:
+    s = safe_text(s, fallback="")
+    s = s.lower().replace("ё", "е")
+    s = re.sub(r"[^\w\s\-\/\.]", " ", s, flags=re.UNICODE)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
+_RU_COLLATOR = icu.Collator.createInstance(icu.Locale("ru_RU")) if icu is not None else None
+
+
+def collation_key(v):
+    """Ключ сортировки названий: ICU (ru_RU), если есть; иначе регистр/ё и номера по значению."""
+    s = safe_text(v, fallback="")
+    if not s:
+        return ""
+    if _RU_COLLATOR is not None:
+        return _RU_COLLATOR.getSortKey(s)
+    s = norm_col(s).strip("\"'«»“” ")
+    return re.sub(r"\d+", lambda m: m.group().zfill(12), s)
+
+
+def html_clean(s: str) -> str:
+    """Убираем отступы, чтобы Streamlit не превращал HTML в code-block."""
+    if s is None:
+        return ""
+    lines = str(s).splitlines()
+    return "\n".join([ln.lstrip() for ln in lines]).strip()
+
+
+# Фото: Google Drive link -> прямая картинка
+def extract_drive_file_id(url: str) -> str:
+    u = safe_text(url, fallback="").strip()
+    if not u:
+        return ""
+    m = re.search(r"/file/d/([a-zA-Z0-9_-]+)", u)
+    if m:
+        return m.group(1)
+    m = re.search(r"[?&]id=([a-zA-Z0-9_-]+)", u)
+    if m:
+        return m.group(1)
+    return ""
+
+
+def drive_image_url(url: str, width: int = 1200) -> str:
+    fid = extract_drive_file_id(url)
+    if not fid:
+        return ""
+    return f"https://drive.google.com/thumbnail?id={fid}&sz=w{int(width)}"
+
+
+# =============================
+# REGISTRIES (several per deployment)
+# =============================
+# Несколько реестров в одном развёртывании (регионы, годы программы) —
+# таблицы [registries.<id>] в Secrets:
+#
+#   [registries.kursk-2025]
+#   title = "Курская область, 2025–2028"
+#   CSV_URL = ["https://...", "sport.xlsx"]
+#   APP_PASSWORD = "..."
+#   ADMIN_PASSWORD = "..."   # вкладка «Дубли»; без него — открыта всем
+#   CACHE_BUDGET_MB = 256
+#
+# Ключ, не заданный у реестра, берётся с верхнего уровня Secrets; каталоги
+# (HISTORY_DIR, SNAPSHOT_DIR, ARTIFACT_DIR) при этом получают подкаталог <id>,
+# чтобы реестры не писали в одно место. Без [registries] — один реестр
+# DEFAULT_REGISTRY из ключей верхнего уровня, как раньше (и только тогда
+# работает запасной .xlsx из репозитория).
+DEFAULT_REGISTRY = "main"
+REGISTRY_DIRS = ("HISTORY_DIR", "SNAPSHOT_DIR", "ARTIFACT_DIR")
+
+
+def registries_secret() -> dict:
+    try:
+        regs = st.secrets.get("registries", None)
+    except Exception:
+        regs = None
+    return dict(regs) if regs else {}
+
+
+def registry_ids() -> list[str]:
+    return [str(r) for r in registries_secret()] or [DEFAULT_REGISTRY]
+
+
+def registry_title(reg: str) -> str:
+    own = registries_secret().get(reg) or {}
+    return str(own.get("title") or reg)
+
+
+def registry_setting(reg: str, name: str, default=None):
+    """Ключ Secrets для реестра reg: свой, иначе верхнего уровня (каталог — с подкаталогом reg)."""
+    regs = registries_secret()
+    own = regs.get(reg) or {}
+    if name in own:
+        return own[name]
+    try:
+        val = st.secrets.get(name, default)
+    except Exception:
+        return default
+    if regs and name in REGISTRY_DIRS and val is not None and str(val).strip():
+        return str(Path(val) / reg)
+    return val
+
+
+# =============================
+# CACHE BUDGET
+# =============================
+# Кеши, которые растут с числом запросов и версий снимка (виды, HTML карточек,
+# поисковые индексы, проекции, таблицы), делят один бюджет памяти: при
+# превышении вытесняется давно не использованная запись любого из них. Запись
+# помечена версией снимка; при смене версии всё, что к ней привязано, уходит
+# сразу. Текущий снимок в бюджете учтён, но не вытесняется. Бюджет у каждого
+# реестра свой: большой реестр не вытесняет прогретые данные маленького.
+CACHE_BUDGET_MB = 512
+
+
+def cache_budget_bytes(reg: str) -> int:
+    return int(float(registry_setting(reg, "CACHE_BUDGET_MB") or CACHE_BUDGET_MB) * 2**20)
+
+
+@st.cache_resource(show_spinner=False)
+def cache_store(reg: str) -> dict:
+    """Записи кешей реестра в порядке использования: (кеш, ключ) -> значение, размер, версия."""
+    return {
+        "lock": threading.Lock(),
+        "entries": OrderedDict(),
+        "bytes": 0,
+        "pinned": {},
+        "budget": cache_budget_bytes(reg),
+        "stats": {},
+        "computing": {},
+        "version": None,
+    }
+
+
+def cache_stats(store: dict, name: str) -> dict:
+    return store["stats"].setdefault(
+        name, {"hits": 0, "misses": 0, "entries": 0, "bytes": 0, "evictions": 0, "invalidated": 0}
+    )
+
+
+# адреса отображённых файлов снимков (map_snapshot): начало -> конец
+MAPPED_REGIONS: dict[int, int] = {}
+
+
+def is_mapped(address: int) -> bool:
+    return any(start <= address < end for start, end in tuple(MAPPED_REGIONS.items()))
+
+
+def column_size(col: pd.Series | pd.Index) -> int:
+    """Память колонки без индекса; буферы Arrow внутри отображённого снимка не считаются."""
+    if isinstance(col.dtype, pd.ArrowDtype):
+        chunks = col.array.__arrow_array__().chunks
+        return sum(b.size for ch in chunks for b in ch.buffers() if b is not None and not is_mapped(b.address))
+    if isinstance(col, pd.Series):
+        return int(col.memory_usage(deep=True, index=False))
+    return int(col.memory_usage(deep=True))
+
+
+def estimate_size(value) -> int:
+    """Память значения, байт: массивы и таблицы — по буферам, контейнеры — по содержимому."""
+    if isinstance(value, np.memmap):
+        return 0  # страницы файла в кеше ОС, не куча процесса
+    if isinstance(value, np.ndarray):
+        if value.dtype != object:
+            # то же для массивов без копии поверх отображённого снимка
+            return 0 if is_mapped(value.__array_interface__["data"][0]) else value.nbytes
+        # одинаковые строки в проекциях — один объект на много позиций
+        return value.nbytes + sum(sys.getsizeof(v) for v in {id(v): v for v in value.ravel()}.values())
+    if isinstance(value, pd.Index):
+        return column_size(value)
+    if isinstance(value, pd.Series):
+        return column_size(value) + column_size(value.index)
+    if isinstance(value, pd.DataFrame):
+        return column_size(value.index) + sum(column_size(value.iloc[:, i]) for i in range(value.shape[1]))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def cache_drop(store: dict, ck: tuple, reason: str | None = None) -> None:
+    """Убирает запись; вызывается под store["lock"]. reason — счётчик в статистике кеша."""
+    entry = store["entries"].pop(ck)
+    stats = cache_stats(store, ck[0])
+    stats["entries"] -= 1
+    stats["bytes"] -= entry["size"]
+    if reason:
+        stats[reason] += 1
+    store["bytes"] -= entry["size"]
+
+
+def cache_evict(store: dict) -> None:
+    limit = store["budget"] - sum(store["pinned"].values())
+    while store["bytes"] > limit and store["entries"]:
+        cache_drop(store, next(iter(store["entries"])), "evictions")
+
+
+def cache_get(reg: str, name: str, key, count: bool = True):
+    """Значение или None; попадание делает запись самой свежей."""
+    store = cache_store(reg)
+    with store["lock"]:
+        entry = store["entries"].get((name, key))
+        if count:
+            cache_stats(store, name)["hits" if entry is not None else "misses"] += 1
+        if entry is None:
+            return None
+        store["entries"].move_to_end((name, key))
+        return entry["value"]
+
+
+def cache_put(reg: str, name: str, key, value, version: str | None = None):
+    """Кладёт значение в бюджет реестра и возвращает его; больше всего бюджета — не кеширует."""
+    size = estimate_size(value)
+    store = cache_store(reg)
+    with store["lock"]:
+        if size > store["budget"] - sum(store["pinned"].values()):
+            return value
+        if (name, key) in store["entries"]:  # другая сессия успела посчитать то же
+            cache_drop(store, (name, key))
+        store["entries"][(name, key)] = {"value": value, "size": size, "version": version}
+        stats = cache_stats(store, name)
+        stats["entries"] += 1
+        stats["bytes"] += size
+        store["bytes"] += size
+        cache_evict(store)
+    return value
+
+
+def cache_invalidate(reg: str, version: str | None = None, name: str | None = None, keep=None) -> int:
+    """
+    Снимает записи реестра версии version (или все записи кеша name);
+    keep(ключ) -> True оставляет запись. Возвращает, сколько снято.
+    """
+    store = cache_store(reg)
+    with store["lock"]:
+        gone = [
+            ck
+            for ck, entry in store["entries"].items()
+            if (version is None or entry["version"] == version)
+            and (name is None or ck[0] == name)
+            and not (keep is not None and keep(ck[1]))
+        ]
+        for ck in gone:
+            cache_drop(store, ck, "invalidated")
+    return len(gone)
+
+
+def cache_switch(reg: str, snap: dict) -> None:
+    """
+    Хук смены версии снимка: снимает всё, что посчитано для прошлой версии,
+    и HTML карточек строк, которых в новом снимке нет (или они изменились).
+    Карточки не привязаны к версии — неизменившаяся строка сохраняет свою.
+    """
+    store = cache_store(reg)
+    with store["lock"]:
+        old = store["version"]
+        if old == snap["version"]:
+            return
+        store["version"] = snap["version"]
+    if old is not None:
+        cache_invalidate(reg, old)
+    live = set(zip(snap["keys"], snap["hashes"].tolist()))
+    cache_invalidate(reg, name="cards", keep=lambda k: k[:2] in live)
+    size = estimate_size(snap)
+    with store["lock"]:
+        store["pinned"]["snapshot"] = size
+        cache_stats(store, "snapshot").update(entries=1, bytes=size)
+        cache_evict(store)
+
+
+def budget_cache(name: str, versioned: bool = True):
+    """
+    Как st.cache_resource, но в бюджете реестра: ключ — аргументы без "_" в
+    начале имени; первый из них — id реестра, второй — версия снимка (если
+    versioned). Значение общее для всех сессий — его не изменяют. Ключ
+    считается один раз: остальные сессии ждут первое вычисление.
+    """
+    def wrap(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def cached(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(v for k, v in bound.arguments.items() if not k.startswith("_"))
+            reg = key[0]
+            value = cache_get(reg, name, key)
+            if value is not None:
+                return value
+            store = cache_store(reg)
+            with store["lock"]:
+                lock = store["computing"].setdefault((name, key), threading.Lock())
+            try:
+                with lock:
+                    value = cache_get(reg, name, key, count=False)
+                    if value is None:
+                        value = cache_put(reg, name, key, fn(*args, **kwargs), key[1] if versioned else None)
+            finally:
+                with store["lock"]:
+                    store["computing"].pop((name, key), None)
+            return value
+
+        return cached
+
+    return wrap
+
+
+def cache_report(reg: str) -> pd.DataFrame:
+    """Состояние кешей реестра для страницы: размер, попадания, вытеснения."""
+    store = cache_store(reg)
+    with store["lock"]:
+        stats = {name: dict(s) for name, s in store["stats"].items()}
+        used, budget = store["bytes"] + sum(store["pinned"].values()), store["budget"]
+    rows = [
+        {
+            "Кеш": name,
+            "Записей": s["entries"],
+            "МБ": round(s["bytes"] / 2**20, 2),
+            "Попаданий, %": round(100 * s["hits"] / (s["hits"] + s["misses"]), 1) if s["hits"] + s["misses"] else None,
+            "Вытеснено": s["evictions"],
+            "Снято": s["invalidated"],
+        }
+        for name, s in sorted(stats.items())
+    ]
+    out = pd.DataFrame(rows, columns=["Кеш", "Записей", "МБ", "Попаданий, %", "Вытеснено", "Снято"])
+    out.attrs.update(used=used, budget=budget)
+    return out
+
+
+# =============================
+# SEARCH: abbreviations
+# =============================
+# assets/abbr.csv — строка на пару «сокращение, полная форма» (у сокращения
+# бывает несколько форм); правится как таблица, формы сравниваются после
+# norm_search. Сокращение ищется целым словом, полная форма — подстрокой.
+ABBR_FILE = Path(__file__).parent / "assets" / "abbr.csv"
+# номер после формы ("сош 5", "школа № 5") переносится на остальные формы группы
+ABBR_NUMBER = re.compile(r" (\d+)\b")
+# запрос раскрываем только по сокращениям от трёх букв: строгий поиск требует
+# все формы, а "го" или "мо" чаще начало слова ("Горшеченский"), чем сокращение
+ABBR_QUERY_MIN_LEN = 3
+
+
+def load_abbr(path: Path) -> dict[str, list[str]]:
+    groups = {}
+    with open(path, encoding="utf-8", newline="") as fh:
+        for row in csv.DictReader(fh):
+            abbr, full = norm_search(row.get("abbr")), norm_search(row.get("full"))
+            if abbr and full and full not in groups.setdefault(abbr, []):
+                groups[abbr].append(full)
+    return groups
+
+
+def trie_pattern(node: dict) -> str:
+    """Регулярное выражение префиксного дерева; длинные продолжения пробуются первыми."""
+    alts = [re.escape(ch) + trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    return f"(?:{body})?" if "" in node else body
+
+
+def compile_matcher(words: set[str], phrases: set[str]) -> dict:
+    """
+    Поиск всех шаблонов за один проход: шаблоны собраны в префиксное дерево и
+    одно регулярное выражение, на каждой позиции текста дерево проходится один
+    раз (как в Aho-Corasick) — стоимость почти не растёт с размером словаря.
+    В позиции находится самый длинный шаблон, более короткие шаблоны-префиксы
+    берутся из таблицы. words ищутся целым словом, phrases — подстрокой.
+    """
+    patterns = sorted(words | phrases, key=len)
+    trie = {}
+    for p in patterns:
+        node = trie
+        for ch in p:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    return {
+        "re": re.compile(f"(?=({trie_pattern(trie)}))") if patterns else None,
+        "prefixes": {p: [q for q in patterns if p.startswith(q)] for p in patterns},
+        "words": words - phrases,
+    }
+
+
+def find_patterns(matcher: dict, text: str) -> list[tuple[str, int]]:
+    """Вхождения шаблонов в текст: (шаблон, позиция конца)."""
+    if matcher["re"] is None:
+        return []
+    out = []
+    for m in matcher["re"].finditer(text):
+        start = m.start()
+        for p in matcher["prefixes"][m.group(1)]:
+            end = start + len(p)
+            if p in matcher["words"] and (
+                (start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())
+            ):
+                continue
+            out.append((p, end))
+    return out
+
+
+@st.cache_resource(show_spinner=False)
+def abbr_dictionary() -> dict:
+    """Группы словаря (сокращение -> полные формы), чьи они (форма -> сокращения) и матчер."""
+    groups = load_abbr(ABBR_FILE) if ABBR_FILE.exists() else {}
+    owners = {}
+    for abbr, fulls in groups.items():
+        for form in [abbr, *fulls]:
+            owners.setdefault(form, []).append(abbr)
+    fulls = {f for fs in groups.values() for f in fs}
+    return {"groups": groups, "owners": owners, "matcher": compile_matcher(set(groups), fulls)}
+
+
+def expand_query_tokens(q: str) -> list[str]:
+    qn = norm_search(q)
+    if not qn:
+        return []
+    parts = qn.split()
+    out = set(parts)
+    out.add(qn)
+    abbr = abbr_dictionary()
+    for p, _ in find_patterns(abbr["matcher"], qn):
+        if len(p) >= ABBR_QUERY_MIN_LEN:
+            out.update(abbr["groups"].get(p, []))
+    return [x for x in out if x]
+
+
+def enrich_blob(blob: str) -> str:
+    """
+    Дописывает к поисковому тексту остальные формы сработавших групп словаря
+    (и с номером, если он стоял после формы). Дописанное проверяется ещё раз:
+    полная форма одной группы может содержать форму другой.
+    """
+    abbr = abbr_dictionary()
+    seen, added, text = set(), [], blob
+    while True:
+        hits = {}
+        for p, end in find_patterns(abbr["matcher"], text):
+            num = ABBR_NUMBER.match(text, end)
+            for a in abbr["owners"][p]:
+                if a not in seen:
+                    hits.setdefault(a, {}).setdefault(p, set()).update([num.group(1)] if num else [])
+        if not hits:
+            break
+        add = []
+        for a, found in hits.items():
+            forms = [a, *abbr["groups"][a]]
+            add += [f for f in forms if f not in found]
+            add += [f"{f} {n}" for src, nums in found.items() for n in sorted(nums) for f in forms if f != src]
+        seen.update(hits)
+        text = " ".join(dict.fromkeys(add))
+        added.append(text)
+    return " ".join([blob, *added])
+
+
+def build_row_search_blob(row: pd.Series) -> str:
+    base = " ".join(
+        [
+            safe_text(row.get("name", ""), ""),
+            safe_text(row.get("object_type", ""), ""),
+            safe_text(row.get("address", ""), ""),
+            safe_text(row.get("responsible", ""), ""),
+            safe_text(row.get("sector", ""), ""),
+            safe_text(row.get("district", ""), ""),
+            safe_text(row.get("status", ""), ""),
+            safe_text(row.get("issues", ""), ""),
+        ]
+    )
+    return enrich_blob(norm_search(base))
+
+
+# =============================
+# SEARCH: ranked, typo-tolerant
+# =============================
+# BM25 по словам поискового текста; слова запроса сопоставляются словарю
+# через триграммы, так что опечатки и обрывки ("льгов") тоже находятся
+WORD_SPLIT = re.compile(r"[\s\-/.]+")
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_BOOST = 3.0  # слово из названия объекта весит как NAME_BOOST вхождений
+FUZZY_MIN_SIM = 0.45  # порог сходства триграмм (коэффициент Дайса)
+FUZZY_MAX_TERMS = 30  # вариантов слова запроса, не больше
+RANK_MIN_SHARE = 0.5  # от лучшего результата; ниже — шум нечёткого совпадения
+RANK_TOP_K = 50  # сколько карточек показываем в режиме ранжирования
+
+
+def trigrams(word: str) -> set[str]:
+    w = f"  {word} "
+    return {w[i : i + 3] for i in range(len(w) - 2)}
+
+
+def words_of(s: str) -> list[str]:
+    return [w for w in WORD_SPLIT.split(s) if w]
+
+
+def build_search_index(blobs: list[str], names: list[str]) -> dict:
+    """
+    Индекс для ранжированного поиска: словарь слов, постинги (строка, вес BM25
+    с усилением названия) по словам и триграммы словаря для нечёткого сопоставления.
+    """
+    n = len(blobs)
+    doc_words = [words_of(b) for b in blobs]
+    name_words = [words_of(norm_search(x)) for x in names]
+
+    flat = [w for ws in doc_words for w in ws]
+    codes, vocab = pd.factorize(pd.Series(flat, dtype=object))
+    term_id = {w: i for i, w in enumerate(vocab)}
+    n_terms = len(vocab)
+    docs = np.repeat(np.arange(n), [len(ws) for ws in doc_words])
+
+    # tf по (слово, строка): вхождения в текст + (NAME_BOOST - 1) за вхождения в название
+    pair = codes.astype(np.int64) * n + docs
+    name_pair = [term_id[w] * n + i for i, ws in enumerate(name_words) for w in ws if w in term_id]
+    pair_u, tf = np.unique(pair, return_counts=True)
+    tf = tf.astype(np.float64)
+    if name_pair:
+        nu, ntf = np.unique(np.asarray(name_pair, dtype=np.int64), return_counts=True)
+        tf[np.searchsorted(pair_u, nu)] += (NAME_BOOST - 1.0) * ntf
+    post_term, post_doc = pair_u // n, pair_u % n
+
+    dl = np.bincount(post_doc, weights=tf, minlength=n)
+    avgdl = dl.mean() if n else 1.0
+    df_t = np.bincount(post_term, minlength=n_terms)
+    idf = np.log(1.0 + (n - df_t + 0.5) / (df_t + 0.5))
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * dl[post_doc] / (avgdl or 1.0))
+    weight = idf[post_term] * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+    # постинги уже упорядочены по слову (pair = слово * n + строка)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(post_term, minlength=n_terms))])
+
+    grams: dict[str, list[int]] = {}
+    for i, w in enumerate(vocab):
+        for g in trigrams(w):
+            grams.setdefault(g, []).append(i)
+
+    return {
+        "n": n,
+        "vocab": list(vocab),
+        "term_id": term_id,
+        "indptr": indptr,
+        "doc": post_doc,
+        "weight": weight,
+        "grams": {g: np.asarray(ids) for g, ids in grams.items()},
+        "gram_count": np.asarray([len(trigrams(w)) for w in vocab]),
+    }
+
+
+def fuzzy_terms(index: dict, word: str) -> list[tuple[int, float]]:
+    """Слова словаря, похожие на слово запроса: (id, сходство)."""
+    exact = index["term_id"].get(word)
+    q_grams = [g for g in trigrams(word) if g in index["grams"]]
+    if not q_grams:
+        return [(exact, 1.0)] if exact is not None else []
+
+    ids, common = np.unique(np.concatenate([index["grams"][g] for g in q_grams]), return_counts=True)
+    sim = 2.0 * common / (len(trigrams(word)) + index["gram_count"][ids])
+    out = {}
+    for i, s in zip(ids.tolist(), sim.tolist()):
+        # начало слова ("льгов" -> "льговский") считаем почти точным совпадением
+        if len(word) >= 3 and index["vocab"][i].startswith(word):
+            s = max(s, 0.9)
+        if s >= FUZZY_MIN_SIM:
+            out[i] = s
+    if exact is not None:
+        out[exact] = 1.0
+    return sorted(out.items(), key=lambda x: -x[1])[:FUZZY_MAX_TERMS]
+
+
+def rank_search(index: dict, q: str, mask: np.ndarray) -> np.ndarray:
+    """
+    Позиции строк под маской по убыванию релевантности. Слово запроса даёт
+    строке лучший вклад среди своих вариантов; вклады слов складываются.
+    """
+    scores = np.zeros(index["n"])
+    for word in dict.fromkeys(words_of(norm_search(q))):
+        best = np.zeros(index["n"])
+        for term, sim in fuzzy_terms(index, word):
+            lo, hi = index["indptr"][term], index["indptr"][term + 1]
+            docs = index["doc"][lo:hi]
+            best[docs] = np.maximum(best[docs], sim * index["weight"][lo:hi])
+        scores += best
+
+    pos = np.flatnonzero(mask & (scores > 0))
+    if not len(pos):
+        return pos
+    pos = pos[scores[pos] >= RANK_MIN_SHARE * scores[pos].max()]
+    return pos[np.argsort(-scores[pos], kind="stable")]
+
+
+@budget_cache("search")
+def search_index(reg: str, version: str, _df: pd.DataFrame) -> dict:
+    """Строится при первом ранжированном запросе к версии снимка."""
+    blobs = _df["search_blob"].astype(str).tolist()
+    return build_search_index(blobs, _df["name"].astype(str).tolist())
+
+
+def save_search_index(index: dict, d: Path) -> None:
+    """Индекс в .npy (словарь триграмм — CSR), чтобы читать через mmap без разбора."""
+    d.mkdir(parents=True, exist_ok=True)
+    grams = sorted(index["grams"])
+    sizes = [len(index["grams"][g]) for g in grams]
+    arrays = {
+        "vocab": np.asarray(index["vocab"], dtype=str),
+        "indptr": index["indptr"],
+        "doc": index["doc"],
+        "weight": index["weight"],
+        "gram_count": index["gram_count"],
+        "grams": np.asarray(grams, dtype=str),
+        "gram_indptr": np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+        "gram_ids": np.concatenate([index["grams"][g] for g in grams]) if grams else np.zeros(0, np.int64),
+    }
+    for name, arr in arrays.items():
+        np.save(d / f"{name}.npy", arr)
+
+
+def load_search_index(d: Path, n: int) -> dict:
+    a = {p.stem: np.load(p, mmap_mode="r") for p in d.glob("*.npy")}
+    vocab = a["vocab"].tolist()
+    gi = a["gram_indptr"]
+    return {
+        "n": n,
+        "vocab": vocab,
+        "term_id": {w: i for i, w in enumerate(vocab)},
+        "indptr": a["indptr"],
+        "doc": a["doc"],
+        "weight": a["weight"],
+        "grams": {g: a["gram_ids"][gi[i] : gi[i + 1]] for i, g in enumerate(a["grams"].tolist())},
+        "gram_count": a["gram_count"],
+    }
+
+
+# =============================
+# SEARCH: per-session result cache
+# =============================
+SEARCH_CACHE_SIZE = 16  # запросов на сессию; только для уточнения запроса
+
+
+def refines(prev_tokens: list[str], tokens: list[str]) -> bool:
+    """Каждое слово прежнего запроса входит в какое-то слово нового -> результат не шире."""
+    return all(any(p in t for t in tokens) for p in prev_tokens)
+
+
+def strict_positions(blobs: np.ndarray, pos: np.ndarray, tokens: list[str]) -> np.ndarray:
+    """Строгий поиск: все слова запроса — подстроки поискового текста."""
+    keep = [all(t in b for t in tokens) for b in blobs[pos]]
+    return pos[np.asarray(keep, dtype=bool)]
+
+
+def refined_base(recent: OrderedDict, version: str, view: tuple, tokens: list[str]) -> np.ndarray | None:
+    """Наименьший прежний результат сессии, который новый строгий запрос уточняет."""
+    base = None
+    for (v, prev_view), prev_pos in recent.items():
+        if v != version or prev_view[:-1] != view[:-1] or (base is not None and len(prev_pos) >= len(base)):
+            continue
+        if refines(expand_query_tokens(prev_view[-1]), tokens):
+            base = prev_pos
+    return base
+
+
+def remember_view(recent: OrderedDict, version: str, view: tuple, found: np.ndarray) -> None:
+    """LRU сессии: последние SEARCH_CACHE_SIZE результатов строгого поиска."""
+    key = (version, view)
+    recent[key] = found
+    recent.move_to_end(key)
+    while len(recent) > SEARCH_CACHE_SIZE:
+        recent.popitem(last=False)
+
+
+# =============================
+# CHANGE: RU labels
+# =============================
+CHANGE_KEY_RU = {
+    "status": "Статус",
+    "works_in_progress": "Работы",
+    "work_flag": "Работы",
+    "issues": "Проблемы",
+    "contractor": "Подрядчик",
+    "contract": "Контракт",
+    "contract_date": "Дата контракта",
+    "contract_price": "Цена контракта",
+    "paid": "Оплачено",
+    "end_date_plan": "Окончание (план)",
+    "end_date_fact": "Окончание (факт)",
+    "target_deadline": "Целевой срок",
+    "readiness": "Готовность",
+    "rns": "РНС",
+    "rns_date": "Дата РНС",
+    "rns_expiry": "Срок РНС",
+    "expertise": "Экспертиза",
+    "expertise_conclusion": "Заключение экспертизы",
+    "expertise_date": "Дата экспертизы",
+    "design": "ПСД",
+    "psd_cost": "Стоимость ПСД",
+    "designer": "Проектировщик",
+    "agreement": "Соглашение",
+    "agreement_date": "Дата соглашения",
+    "agreement_amount": "Сумма соглашения",
+}
+
+
+def translate_change_what(raw: str) -> str:
+    s = safe_text(raw, "—").strip()
+    if s == "—" or not s:
+        return "—"
+
+    parts = re.split(r"[|,;\n]+", s)
+    parts = [p.strip() for p in parts if p.strip()]
+
+    out = []
+    for p in parts:
+        key = norm_col(p)
+        out.append(CHANGE_KEY_RU.get(key, p))
+
+    uniq = []
+    for x in out:
+        if x not in uniq:
+            uniq.append(x)
+
+    return ", ".join(uniq) if uniq else "—"
+
+
+# =============================
+# DATA LOADING
+# =============================
+# поле схемы -> варианты названия колонки в реестре (порядок важен, см. pick_col)
+FIELDS = {
+    "id": ["id", "ID"],
+    "sector": ["sector", "отрасль"],
+    "district": ["district", "район"],
+    "name": ["name", "object_name", "наименование_объекта", "наименование объекта", "объект"],
+    "object_type": ["object_type", "тип", "вид объекта"],
+    "address": ["address", "адрес"],
+    "responsible": ["responsible", "ответственный"],
+    "status": ["status", "статус"],
+    # works_in_progress / works
+    "work_flag": ["works_in_progress", "work_flag", "работы", "works"],
+    "issues": ["issues", "проблемы", "проблемные вопросы"],
+    # (не показываем отдельным чипом, но используем, если нужно)
+    "updated_at": ["updated_at", "last_update", "обновлено", "updated"],
+    "card_url_text": ["card_url_text", "card_url", "ссылка_на_карточку_(google)", "ссылка на карточку", "ссылка_на_карточку"],
+    "photo_url": ["photo_url", "photo", "фото", "ссылка_на_фото", "ссылка на фото"],
+    # --- Изменения (новые колонки реестра) ---
+    "card_updated_at": ["card_updated_at", "card_updated_drive", "card_updated_at", "обновлено_карточка"],
+    "change_level": ["change_level", "уровень_изменения", "значимость", "change_severity"],
+    "change_what": ["change_what", "что_изменили", "what_changed"],
+    "change_note": ["change_note", "комментарий", "comment"],
+    # Паспортные поля (как было)
+    "state_program": ["state_program", "гп", "государственная программа"],
+    "federal_project": ["federal_project", "фп", "федеральный проект"],
+    "regional_program": ["regional_program", "рп", "региональная программа"],
+    "agreement": ["agreement", "соглашение", "номер соглашения"],
+    "agreement_date": ["agreement_date", "дата соглашения"],
+    "agreement_amount": ["agreement_amount", "сумма соглашения"],
+    "capacity_seats": ["capacity_seats", "мощность", "мест", "посещений"],
+    "area_m2": ["area_m2", "площадь", "м2", "кв.м"],
+    "target_deadline": ["target_deadline", "целевой срок"],
+    "design": ["design", "проектирование", "псд"],
+    "psd_cost": ["psd_cost", "стоимость псд"],
+    "designer": ["designer", "проектировщик"],
+    "expertise": ["expertise", "экспертиза"],
+    "expertise_conclusion": ["expertise_conclusion", "заключение экспертизы"],
+    "expertise_date": ["expertise_date", "дата экспертизы"],
+    "rns": ["rns", "рнс"],
+    "rns_date": ["rns_date", "дата рнс"],
+    "rns_expiry": ["rns_expiry", "срок действия рнс"],
+    "contract": ["contract", "контракт", "номер контракта"],
+    "contract_date": ["contract_date", "дата контракта"],
+    "contractor": ["contractor", "подрядчик"],
+    "contract_price": ["contract_price", "цена контракта", "стоимость контракта"],
+    "end_date_plan": ["end_date_plan", "окончание план"],
+    "end_date_fact": ["end_date_fact", "окончание факт"],
+    "readiness": ["readiness", "готовность"],
+    "paid": ["paid", "оплачено"],
+}
+
+# Группы колонок: список карточек и индексы грузятся сразу, паспорт — по требованию
+LIST_FIELDS = [
+    "id",
+    "sector",
+    "district",
+    "name",
+    "object_type",
+    "address",
+    "responsible",
+    "status",
+    "work_flag",
+    "issues",
+    "card_url_text",
+    "photo_url",
+    "card_updated_at",
+    "change_level",
+    "change_what",
+    "change_note",
+]
+INDEX_FIELDS = [
+    "updated_at",
+    "target_deadline",
+    "expertise_date",
+    "rns_expiry",
+    "end_date_plan",
+    "contract_price",
+    "paid",
+    "readiness",
+    "rns",
+]
+MAIN_FIELDS = LIST_FIELDS + INDEX_FIELDS
+PASSPORT_FIELDS = [f for f in FIELDS if f not in MAIN_FIELDS]
+
+
+def resolve_fields(columns: list[str], fields: list[str] | None = None) -> dict[str, str | None]:
+    """Поле схемы -> колонка источника (или None)."""
+    probe = pd.DataFrame(columns=columns)
+    return {f: pick_col(probe, FIELDS[f]) for f in (fields or FIELDS)}
+
+
+def source_columns(columns: list[str], fields: list[str] | None) -> list[str] | None:
+    if fields is None:
+        return None
+    mapping = resolve_fields([str(c).strip() for c in columns], list(fields))
+    return [c for c in dict.fromkeys(mapping.values()) if c]
+
+
+# несколько источников (листы отраслей) грузятся параллельно
+LOAD_WORKERS = 4
+SOURCE_TIMEOUT = 60  # секунд на источник, от начала его загрузки до конца
+SOURCE_READ_TIMEOUT = 15  # секунд тишины сокета (requests ограничивает только её)
+
+
+@st.cache_data(show_spinner=False, ttl=120)
+def fetch_source(src: str) -> bytes:
+    """Байты источника (URL или локальный файл) — одна загрузка на все проекции."""
+    if re.match(r"^https?://", src, flags=re.I):
+        # сервер, отдающий по байту, таймаут чтения не сработает: читаем кусками
+        # и сверяемся со сроком источника
+        deadline = time.monotonic() + SOURCE_TIMEOUT
+        chunks = []
+        with requests.get(src, timeout=SOURCE_READ_TIMEOUT, stream=True) as r:
+            r.raise_for_status()
+            # read1 (urllib3 >= 2.3) отдаёт то, что уже пришло, не дожидаясь полного куска
+            read = getattr(r.raw, "read1", r.raw.read)
+            while chunk := read(1 << 16, decode_content=True):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"загрузка дольше {SOURCE_TIMEOUT} с")
+                chunks.append(chunk)
+        return b"".join(chunks)
+    return Path(src).read_bytes()
+
+
+# столько пустых строк подряд — конец таблицы (ниже бывают подвалы и мусор форматирования)
+XLSX_BLANK_RUN = 20
+
+
+def calamine_value(v):
+    """Значение calamine к виду openpyxl: целые числа — int, даты — datetime, пусто — None."""
+    if v == "":
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, date) and not isinstance(v, datetime):
+        return datetime(v.year, v.month, v.day)
+    return v
+
+
+def xlsx_rows(data: bytes):
+    """Строки первого листа по одной: calamine, если установлен, иначе openpyxl read_only."""
+    if CalamineWorkbook is not None:
+        sheet = CalamineWorkbook.from_filelike(io.BytesIO(data)).get_sheet_by_index(0)
+        for row in sheet.iter_rows():
+            yield [calamine_value(v) for v in row]
+        return
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_xlsx(data: bytes, fields: list[str] | None) -> pd.DataFrame:
+    """
+    Потоковое чтение .xlsx без объектной модели книги: берём только колонки
+    нужных полей, пустые строки пропускаем, на XLSX_BLANK_RUN пустых подряд
+    останавливаемся. Форматирование и скрытые листы не читаются.
+    """
+    rows = xlsx_rows(data)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    # имена как у read_excel: пустые — "Unnamed: i", повторы — "x.1", "x.2"
+    names, seen = [], {}
+    for i, c in enumerate(header):
+        name = f"Unnamed: {i}" if c is None else str(c)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    wanted = source_columns(names, fields)
+    picked = [i for i, c in enumerate(names) if wanted is None or c.strip() in wanted]
+
+    cols = {i: [] for i in picked}
+    blank = 0
+    for row in rows:
+        # пустота — по всей строке, иначе проекции и полное чтение разойдутся по строкам
+        if all(v is None or (isinstance(v, str) and not v.strip()) for v in row):
+            blank += 1
+            if blank >= XLSX_BLANK_RUN:
+                break
+            continue
+        blank = 0
+        for i in picked:
+            cols[i].append(row[i] if i < len(row) else None)
+    rows.close()
+    return pd.DataFrame({names[i]: cols[i] for i in picked})
+
+
+def read_projected(src: str, fields: list[str] | None, data: bytes | None = None) -> pd.DataFrame:
+    """Читает источник, разбирая только колонки нужных полей (usecols / columns)."""
+    kind = Path(src.split("?")[0]).suffix.lower()
+    if data is None:
+        data = fetch_source(src)
+
+    if kind == ".parquet":
+        data = io.BytesIO(data)
+        names = pq.read_schema(data).names
+        return pd.read_parquet(data, columns=source_columns(names, fields))
+
+    if kind in (".xlsx", ".xlsm"):
+        return read_xlsx(data, fields)
+
+    # разделитель: "," или ";" (выгрузки из Excel) — сначала тот, которого больше в заголовке
+    first = data.split(b"\n", 1)[0]
+    for sep in (";", ",") if first.count(b";") > first.count(b",") else (",", ";"):
+        try:
+            header = pd.read_csv(io.BytesIO(data), nrows=0, sep=sep).columns
+            wanted = source_columns(list(header), fields)
+            usecols = None if wanted is None else (lambda c: str(c).strip() in wanted)
+            return pd.read_csv(io.BytesIO(data), usecols=usecols, sep=sep)
+        except Exception:
+            continue
+    return pd.DataFrame()
+
+
+@st.cache_resource(show_spinner=False)
+def source_store() -> dict:
+    """Последние удачные байты и состояние каждого источника (общие для всех сессий)."""
+    return {"bytes": {}, "status": {}}
+
+
+def read_source(src: str, fields: list[str] | None) -> pd.DataFrame:
+    """read_projected с откатом на последнюю удачную версию источника."""
+    store = source_store()
+    try:
+        df = read_projected(src, fields)
+        if df.empty:
+            raise ValueError("источник пуст или не разобран")
+    except Exception as e:
+        source_failed(src, str(e) or type(e).__name__)
+        return read_last_good(src, fields)
+    store["bytes"][src] = fetch_source(src)
+    store["status"][src] = {"ok": True, "at": time.time(), "error": ""}
+    return df
+
+
+def source_failed(src: str, error: str) -> None:
+    status = source_store()["status"]
+    status[src] = {"ok": False, "at": status.get(src, {}).get("at"), "error": error}
+
+
+def read_last_good(src: str, fields: list[str] | None) -> pd.DataFrame:
+    data = source_store()["bytes"].get(src)
+    if data is None:
+        return pd.DataFrame()
+    return read_projected(src, fields, data)
+
+
+def source_list(reg: str) -> list[str]:
+    """CSV_URL реестра в Secrets: одна строка или список (CSV-ссылки, пути к .xlsx)."""
+    val = registry_setting(reg, "CSV_URL")
+    if not val:
+        return []
+    items = [val] if isinstance(val, str) else list(val)
+    return [str(s).strip() for s in items if str(s).strip()]
+
+
+def load_sources(sources: list[str], fields: tuple[str, ...] | None) -> pd.DataFrame:
+    """
+    Несколько источников параллельно, не больше LOAD_WORKERS потоков. Источник,
+    упавший или не уложившийся в SOURCE_TIMEOUT с начала своей загрузки, берётся
+    из последней удачной загрузки и не задерживает остальные. Колонки в листах
+    разных отраслей названы по-разному, поэтому объединяем после normalize_schema.
+    """
+    wanted = list(fields) if fields else None
+    workers = min(LOAD_WORKERS, len(sources))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="registry-load")
+    started = {}
+
+    def run(src: str) -> pd.DataFrame:
+        started[src] = time.monotonic()
+        return read_source(src, wanted)
+
+    futures = {pool.submit(run, src): src for src in sources}
+    # срок у каждого источника свой: SOURCE_TIMEOUT с момента, когда поток взял
+    # его в работу (источники сверх LOAD_WORKERS ждут свободного потока). Поток
+    # просроченного источника не прервать — его бросаем; fetch_source сам
+    # прекращает чтение к тому же сроку и освобождает поток очереди
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        left = {f: SOURCE_TIMEOUT - (now - started[futures[f]]) for f in pending if futures[f] in started}
+        pending -= {f for f, s in left.items() if s <= 0}
+        if not pending:
+            break
+        timeout = min([s for s in left.values() if s > 0], default=SOURCE_TIMEOUT)
+        _, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    parts = []
+    for fut, src in futures.items():
+        if fut.done() and not fut.cancelled():
+            part = fut.result()
+        else:
+            source_failed(src, f"нет ответа за {SOURCE_TIMEOUT} с")
+            part = read_last_good(src, wanted)
+        if not part.empty:
+            part.columns = [str(c).strip() for c in part.columns]
+            parts.append(normalize_schema(part, wanted))
+
+    if not parts:
+        return pd.DataFrame()
+    return compact_strings(pd.concat(parts, ignore_index=True))
+
+
+def failed_sources(reg: str) -> list[str]:
+    status = source_store()["status"]
+    return [src for src in source_list(reg) if not status.get(src, {"ok": True})["ok"]]
+
+
+@st.cache_data(show_spinner=False, ttl=120)
+def load_data(reg: str, fields: tuple[str, ...] | None = None, sources: tuple[str, ...] | None = None) -> pd.DataFrame:
+    t0 = time.perf_counter()
+    sources = list(sources) if sources else source_list(reg)
+    df = pd.DataFrame()
+    mode = "sources"
+
+    if len(sources) == 1:
+        try:
+            df = read_source(sources[0], list(fields) if fields else None)
+        except Exception:
+            df = pd.DataFrame()
+    elif sources:
+        df = load_sources(sources, fields)
+
+    if df.empty and not registries_secret():
+        mode = "xlsx_fallback"
+        candidates = [
+            "РЕЕСТР_объектов_Курская_область_2025-2028.xlsx",
+            "registry.xlsx",
+            "data.xlsx",
+        ]
+        for name in candidates:
+            p = Path(__file__).parent / name
+            if p.exists():
+                try:
+                    df = read_projected(str(p), fields)
+                    break
+                except Exception:
+                    pass
+
+    part = "main" if fields else "full"
+    metric_observe("registry_refresh_seconds", time.perf_counter() - t0, registry=reg, part=part)
+    if df is None or df.empty:
+        mode = "none"
+    for m in ("sources", "xlsx_fallback", "none"):
+        metric_set("registry_data_source", float(m == mode), registry=reg, part=part, mode=m)
+    if mode == "none":
+        return pd.DataFrame()
+
+    metric_set("registry_refresh_timestamp_seconds", time.time(), registry=reg, part=part)
+    metric_set("registry_source_rows", len(df), registry=reg, part=part)
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def normalize_schema(df: pd.DataFrame, fields: list[str] | None = None) -> pd.DataFrame:
+    if df.empty:
+        return df
+
+    out = pd.DataFrame(index=df.index)
+    for f, c in resolve_fields(list(df.columns), fields).items():
+        out[f] = df[c] if c else ""
+
+    for c in out.columns:
+        out[c] = out[c].fillna("").astype(str).replace({"nan": "", "None": "", "null": ""})
+
+    return compact_strings(out)
+
+
+# =============================
+# COMPACT STRING STORAGE
+# =============================
+# колонка хранится как category, если уникальных значений не больше этой доли строк
+CATEGORY_MAX_SHARE = 0.5
+ARROW_STR = pd.ArrowDtype(pa.string())
+
+
+def compact_strings(df: pd.DataFrame, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Строковые колонки в компактные типы по кардинальности: повторяющиеся
+    значения (отрасль, район, статус, подрядчик, программы) — category,
+    остальные — строки Arrow в одном буфере вместо объектов Python.
+    """
+    out = df.copy()
+    for c in columns if columns is not None else list(df.columns):
+        s = df[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            s = s.astype(str)
+        elif not pd.api.types.is_string_dtype(s.dtype):
+            continue
+        if s.nunique(dropna=False) <= len(s) * CATEGORY_MAX_SHARE:
+            out[c] = s.astype("category")
+        else:
+            out[c] = s.astype(ARROW_STR)
+    return out
+
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Память по колонкам: текущий тип и размер против хранения объектами Python."""
+    rows = []
+    for c in df.columns:
+        s = df[c]
+        size = int(s.memory_usage(deep=True, index=False))
+        textual = isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(s.dtype)
+        as_object = int(s.astype(object).memory_usage(deep=True, index=False)) if textual else size
+        rows.append(
+            {
+                "Колонка": c,
+                "Тип": str(s.dtype),
+                "Уникальных": int(s.nunique(dropna=False)),
+                "Байт": size,
+                "Байт (object)": as_object,
+            }
+        )
+    out = pd.DataFrame(rows).sort_values("Байт", ascending=False, ignore_index=True)
+    total = {"Колонка": "Итого", "Тип": "", "Уникальных": len(df)}
+    total.update({k: int(out[k].sum()) for k in ("Байт", "Байт (object)")})
+    return pd.concat([out, pd.DataFrame([total])], ignore_index=True)
+
+
+# =============================
+# PREPARED SNAPSHOT (incremental refresh)
+# =============================
+# типизированные колонки (только поля основной группы: сводка, сроки, сортировка)
+DATE_COLS = ["updated_at", "card_updated_at", "target_deadline", "expertise_date", "rns_expiry", "end_date_plan"]
+MONEY_COLS = ["contract_price", "paid"]
+FACET_COLS = ["sector", "district", "status", "_change_ru"]
+RISK_DATE_COLS = ["rns_expiry", "end_date_plan", "target_deadline", "expertise_date"]
+SORT_KEYS = {
+    "readiness": "_n_readiness",
+    "card_updated_at": "_d_card_updated_at",
+    "contract_price": "_n_contract_price",
+    "end_date_plan": "_d_end_date_plan",
+    "name": "_sort_name",
+}
+
+
+def derive_rows(norm: pd.DataFrame) -> pd.DataFrame:
+    """Производные колонки: поисковый текст, изменения, типизированные даты и суммы."""
+    out = norm.copy()
+    out["search_blob"] = [build_row_search_blob(r) for _, r in out.iterrows()]
+    out["_change_ru"] = out["change_level"].map(change_level_to_ru)
+    for c in DATE_COLS:
+        out[f"_d_{c}"] = pd.to_datetime(out[c].map(try_parse_date), errors="coerce")
+    for c in MONEY_COLS:
+        out[f"_n_{c}"] = pd.to_numeric(out[c].map(parse_money), errors="coerce")
+    out["_n_readiness"] = pd.to_numeric(out["readiness"].map(parse_readiness), errors="coerce")
+    out["_works_color"] = out["work_flag"].map(works_color)
+    out["_sort_name"] = out["name"].map(collation_key)
+    return compact_strings(out, ["search_blob", "_change_ru", "_works_color"])
+
+
+# без id строку узнаём по этим полям: правка остальных полей не меняет ключ
+ROW_ID_FIELDS = ["name", "address", "district"]
+
+
+def row_keys(raw: pd.DataFrame) -> list[str]:
+    """
+    Ключ строки: id из реестра; без id — дайджест названия, адреса и района
+    (одинаков после перезапуска и на всех репликах). Повторы получают суффикс
+    #n в порядке строк.
+    """
+    cols = resolve_fields(list(raw.columns), ["id"] + ROW_ID_FIELDS)
+
+    def values(f: str) -> list[str]:
+        if not cols[f]:
+            return [""] * len(raw)
+        return raw[cols[f]].fillna("").astype(str).replace({"nan": "", "None": "", "null": ""}).str.strip().tolist()
+
+    ident = zip(*(map(norm_search, values(f)) for f in ROW_ID_FIELDS))
+    keys, seen = [], {}
+    for rid, parts in zip(values("id"), ident):
+        k = rid or "o" + hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+        n = seen.get(k, 0)
+        seen[k] = n + 1
+        keys.append(k if n == 0 else f"{k}#{n}")
+    return keys
+
+
+def dom_id(key: str) -> str:
+    """Ключ строки -> HTML id; если пришлось заменять символы, добавляем дайджест."""
+    safe = re.sub(r"[^a-zA-Z0-9_]+", "_", key)
+    return safe if safe == key else f"{safe}_{hashlib.blake2b(key.encode('utf-8'), digest_size=4).hexdigest()}"
+
+
+def build_facets(df: pd.DataFrame) -> dict[str, dict[str, np.ndarray]]:
+    facets = {}
+    for c in FACET_COLS:
+        codes, uniques = pd.factorize(df[c].astype(str))
+        facets[c] = {str(v): codes == i for i, v in enumerate(uniques)}
+    return facets
+
+
+def build_date_index(df: pd.DataFrame) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Для дат рисков: отсортированные дни (int) и позиции строк — диапазон ищем бинарным поиском."""
+    index = {}
+    for c in RISK_DATE_COLS:
+        d = df[f"_d_{c}"]
+        pos = np.flatnonzero(d.notna().to_numpy())
+        days = d.to_numpy(dtype="datetime64[ns]")[pos].astype("datetime64[D]").astype(np.int64)
+        order = np.argsort(days, kind="stable")
+        index[c] = (days[order], pos[order])
+    return index
+
+
+def build_sort_perms(df: pd.DataFrame) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Перестановки строк (по возрастанию, по убыванию); пустые значения всегда в конце."""
+    perms = {}
+    for key, col in SORT_KEYS.items():
+        s = df[col]
+        valid = (s != "").to_numpy() if key == "name" else s.notna().to_numpy()
+        pos = np.flatnonzero(valid)
+        nulls = np.flatnonzero(~valid)
+        codes = np.unique(s.to_numpy()[pos], return_inverse=True)[1].ravel()
+        asc = pos[np.lexsort((pos, codes))]
+        desc = pos[np.lexsort((pos, -codes))]
+        perms[key] = (np.concatenate([asc, nulls]), np.concatenate([desc, nulls]))
+    return perms
+
+
+def snapshot_indexes(df: pd.DataFrame) -> dict:
+    """Индексы снимка, которые дешевле пересобрать целиком, чем патчить."""
+    return {"date_index": build_date_index(df), "sort_perms": build_sort_perms(df)}
+
+
+def patch_facets(old: dict, src: np.ndarray, fresh_pos: np.ndarray, fresh: pd.DataFrame) -> dict:
+    """Переносим маски со старых позиций, пересчитываем только изменившиеся строки."""
+    kept = src >= 0
+    facets = {}
+    for c in FACET_COLS:
+        vals = fresh[c].astype(str).to_numpy()
+        masks = {}
+        for v in set(old.get(c, {})) | set(vals.tolist()):
+            m = np.zeros(len(src), dtype=bool)
+            if v in old.get(c, {}):
+                m[kept] = old[c][v][src[kept]]
+            m[fresh_pos] = vals == v
+            if m.any():
+                masks[v] = m
+        facets[c] = masks
+    return facets
+
+
+def prepare_snapshot(raw: pd.DataFrame, prev: dict | None = None) -> dict:
+    """
+    Готовит снимок реестра. Если есть предыдущий снимок с той же схемой,
+    нормализация и производные данные считаются только для вставленных
+    и изменённых строк (по хешу строки, сопоставление по id).
+    """
+    hashes = pd.util.hash_pandas_object(raw, index=False).to_numpy()
+    keys = row_keys(raw)
+    columns = list(raw.columns)
+
+    if prev is None or prev["columns"] != columns:
+        df = derive_rows(normalize_schema(raw, MAIN_FIELDS))
+        df.index = pd.Index(keys, name="_key")
+        stats = {"inserted": len(df), "updated": 0, "deleted": 0, "full": True}
+        facets = build_facets(df)
+    else:
+        src = pd.Index(prev["keys"]).get_indexer(keys)
+        same = src >= 0
+        same[same] = prev["hashes"][src[same]] == hashes[same]
+        src = np.where(same, src, -1)
+        fresh_pos = np.flatnonzero(~same)
+
+        kept_df = prev["df"].iloc[src[same]]
+        if len(fresh_pos):
+            fresh_df = derive_rows(normalize_schema(raw.iloc[fresh_pos], MAIN_FIELDS))
+            fresh_df.index = pd.Index([keys[i] for i in fresh_pos], name="_key")
+            order = np.argsort(np.concatenate([np.flatnonzero(same), fresh_pos]), kind="stable")
+            df = pd.concat([kept_df, fresh_df]).iloc[order]
+            # категории старых и новых строк разные: после склейки выбираем типы заново
+            df = compact_strings(df, [c for c in df.columns if c != "_sort_name"])
+        else:
+            fresh_df = prev["df"].iloc[:0]
+            df = kept_df
+
+        inserted = int((~pd.Index(keys).isin(prev["keys"])).sum())
+        deleted = len(set(prev["keys"]) - set(keys))
+        stats = {"inserted": inserted, "updated": len(fresh_pos) - inserted, "deleted": deleted, "full": False}
+        facets = patch_facets(prev["facets"], src, fresh_pos, fresh_df)
+
+    df = df.assign(_hash=hashes)
+    return {
+        "version": hashlib.sha1(hashes.tobytes() + "|".join(columns).encode("utf-8")).hexdigest()[:12],
+        "columns": columns,
+        "keys": keys,
+        "hashes": hashes,
+        "df": df,
+        "facets": facets,
+        "stats": stats,
+        "built_at": time.time(),
+        **snapshot_indexes(df),
+    }
+
+
+def base_columns(df: pd.DataFrame) -> list[str]:
+    """Колонки normalize_schema (без производных)."""
+    return [c for c in df.columns if c != "search_blob" and not c.startswith("_")]
+
+
+# =============================
+# PASSPORT (lazy column group)
+# =============================
+@budget_cache("passport")
+def passport_frame(reg: str, version: str, main_columns: tuple[str, ...]) -> pd.DataFrame:
+    """
+    Паспортные поля снимка version, по ключам строк. Читаются из источника
+    только когда нужны паспорт или выгрузка; ключи считаются так же, как в
+    prepare_snapshot (по колонкам основной группы).
+    """
+    path = artifact_file(reg, version, "passport.arrow")
+    if path is not None:
+        return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all().to_pandas().set_index("_key")
+    return passport_from_raw(load_data(reg), main_columns)
+
+
+def passport_from_raw(raw: pd.DataFrame, main_columns: tuple[str, ...]) -> pd.DataFrame:
+    if raw.empty or not set(main_columns) <= set(raw.columns):
+        return pd.DataFrame(columns=PASSPORT_FIELDS + ["_phash"])
+    keys = row_keys(raw[list(main_columns)])
+    out = normalize_schema(raw, PASSPORT_FIELDS)
+    out["_phash"] = pd.util.hash_pandas_object(out, index=False).to_numpy()
+    out.index = pd.Index(keys, name="_key")
+    return out
+
+
+def export_frame(df: pd.DataFrame, passport: pd.DataFrame) -> pd.DataFrame:
+    """Строки df со всеми полями схемы (основная группа + паспорт) в порядке FIELDS."""
+    full = df[[f for f in MAIN_FIELDS if f in df.columns]].join(passport[PASSPORT_FIELDS], how="left")
+    return full[[f for f in FIELDS if f in full.columns]]
+
+
+# =============================
+# DISPLAY PROJECTION
+# =============================
+def project_display(df: pd.DataFrame, spec: dict) -> dict[str, np.ndarray]:
+    """
+    Готовые строки для карточек: spec — поле -> (колонка, функция значения).
+    Каждая колонка разбирается один раз, функции считаются по её уникальным
+    значениям; колонка "_key" — ключ строки. Колонок, которых нет в df, нет и в ответе.
+    """
+    by_col = {}
+    for field, (col, fn) in spec.items():
+        by_col.setdefault(col, []).append((field, fn))
+
+    out = {}
+    for col, fns in by_col.items():
+        if col == "_key":
+            keys = df.index.astype(str).tolist()
+            for field, fn in fns:
+                out[field] = np.array([fn(k) for k in keys], dtype=object)
+            continue
+        if col not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        for field, fn in fns:
+            values = np.empty(len(uniques), dtype=object)
+            values[:] = [fn(v) for v in uniques]
+            out[field] = values[codes]
+    return out
+
+
+@budget_cache("display")
+def display_projection(reg: str, version: str, part: str, _df: pd.DataFrame, _spec: dict) -> dict[str, np.ndarray]:
+    """Кеш по (реестр, версия снимка, часть): "main" — строки снимка, "passport" — паспорт."""
+    return project_display(_df, _spec)
+
+
+# =============================
+# SNAPSHOT HISTORY
+# =============================
+# history/
+#   manifest.jsonl        — по строке на снимок (seq, version, ts, rows, added, removed)
+#   deltas/<seq>.parquet  — какие ключи появились/изменились (+) и ушли (-)
+#   rows/<seq>.parquet    — только новые версии строк (по хешу), колоночно, zstd
+def history_dir(reg: str) -> Path | None:
+    d = registry_setting(reg, "HISTORY_DIR")
+    if d is not None and not str(d).strip():
+        return None
+    if d:
+        return Path(d)
+    base = Path(__file__).parent / "history"
+    return base / reg if registries_secret() else base
+
+
+def history_manifest(hdir: Path) -> list[dict]:
+    p = hdir / "manifest.jsonl"
+    if not p.exists():
+        return []
+    return [json.loads(ln) for ln in p.read_text(encoding="utf-8").splitlines() if ln.strip()]
+
+
+def history_replay(hdir: Path, upto_seq: int) -> dict[str, tuple[int, int]]:
+    """Состав реестра на снимок upto_seq: ключ -> (хеш строки, позиция)."""
+    active = {}
+    for m in history_manifest(hdir):
+        if m["seq"] > upto_seq:
+            break
+        d = pd.read_parquet(hdir / "deltas" / f"{m['seq']:06d}.parquet")
+        for op, k, h, p in zip(d["_op"], d["_key"], d["_hash"].tolist(), d["_pos"].tolist()):
+            if op == "-":
+                active.pop(k, None)
+            else:
+                active[k] = (h, p)
+    return active
+
+
+def history_rows(hdir: Path, seq: int, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Строки реестра на снимок seq; из файлов читаются только нужные колонки
+    (тех, что появились позже файла, в нём нет — их не читаем).
+    """
+    active = sorted(history_replay(hdir, seq).items(), key=lambda kv: kv[1][1])
+    need = np.array([h for _, (h, _) in active], dtype=np.uint64)
+
+    frames = []
+    for f in sorted((hdir / "rows").glob("*.parquet")):
+        if int(f.stem) > seq:
+            break
+        if columns is None:
+            t = pd.read_parquet(f)
+        else:
+            present = set(pq.read_schema(f).names)
+            t = pd.read_parquet(f, columns=["_hash"] + [c for c in columns if c in present])
+        frames.append(t[t["_hash"].isin(need)])
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+
+    rows = pd.concat(frames, ignore_index=True).drop_duplicates("_hash").set_index("_hash")
+    out = rows.loc[need].reset_index()
+    out.index = pd.Index([k for k, _ in active], name="_key")
+    return out
+
+
+def history_state(hdir: Path) -> dict:
+    manifest = history_manifest(hdir)
+    seq = manifest[-1]["seq"] if manifest else -1
+    known = set()
+    for f in (hdir / "rows").glob("*.parquet"):
+        if int(f.stem) <= seq:
+            known.update(pd.read_parquet(f, columns=["_hash"])["_hash"].tolist())
+    return {"seq": seq, "active": history_replay(hdir, seq) if seq >= 0 else {}, "known": known}
+
+
+def record_history(snap: dict, hist: dict, hdir: Path) -> None:
+    """
+    Дописывает снимок в историю под flock: каталог history/ общий для реплик,
+    и без лока две из них выдали бы один seq и затёрли бы rows/<seq>.parquet друг друга.
+    """
+    hdir.mkdir(parents=True, exist_ok=True)
+    with open(hdir / "history.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = history_manifest(hdir)
+        if (manifest[-1]["seq"] if manifest else -1) != hist["seq"]:
+            # пока мы не держали лок, историю дописала другая реплика
+            hist.update(history_state(hdir))
+        write_history(snap, hist, hdir)
+
+
+def write_history(snap: dict, hist: dict, hdir: Path) -> None:
+    """Дописывает снимок в историю, если состав или содержимое строк изменились."""
+    new = {k: (int(h), i) for i, (k, h) in enumerate(zip(snap["keys"], snap["hashes"].tolist()))}
+    active = hist["active"]
+    added = [k for k, (h, _) in new.items() if active.get(k, (None,))[0] != h]
+    removed = [k for k in active if k not in new]
+    if not added and not removed:
+        return
+
+    seq = hist["seq"] + 1
+    (hdir / "deltas").mkdir(parents=True, exist_ok=True)
+    (hdir / "rows").mkdir(parents=True, exist_ok=True)
+
+    fresh_pos = sorted({new[k][1] for k in added if new[k][0] not in hist["known"]})
+    if fresh_pos:
+        df = snap["df"]
+        rows = df.iloc[fresh_pos][base_columns(df)].reset_index(drop=True)
+        rows.insert(0, "_hash", snap["hashes"][fresh_pos])
+        rows = rows.drop_duplicates("_hash")
+        # category тянула бы в каждый файл весь словарь снимка (все даты, суммы):
+        # пишем строками, типы восстанавливает history_snapshot (compact_strings)
+        cats = [c for c in rows.columns if isinstance(rows[c].dtype, pd.CategoricalDtype)]
+        rows = rows.astype({c: ARROW_STR for c in cats})
+        # копия схемы Arrow (store_schema) весит больше одной строки данных
+        rows.to_parquet(hdir / "rows" / f"{seq:06d}.parquet", compression="zstd", index=False, store_schema=False)
+
+    delta = pd.DataFrame(
+        {
+            "_op": ["+"] * len(added) + ["-"] * len(removed),
+            "_key": added + removed,
+            "_hash": np.array([new[k][0] for k in added] + [0] * len(removed), dtype=np.uint64),
+            "_pos": [new[k][1] for k in added] + [-1] * len(removed),
+        }
+    )
+    delta.to_parquet(hdir / "deltas" / f"{seq:06d}.parquet", compression="zstd", index=False)
+
+    entry = {
+        "seq": seq,
+        "version": snap["version"],
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "rows": len(new),
+        "added": len(added),
+        "removed": len(removed),
+    }
+    with open(hdir / "manifest.jsonl", "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    hist["seq"] = seq
+    hist["active"] = new
+    hist["known"].update(new[k][0] for k in added)
+
+
+def history_entry_as_of(manifest: list[dict], as_of: date) -> dict | None:
+    """Запись манифеста, действовавшая на дату as_of (номера seq — не позиции в списке)."""
+    entries = [m for m in manifest if datetime.fromisoformat(m["ts"]).date() <= as_of]
+    return max(entries, key=lambda m: m["seq"]) if entries else None
+
+
+@budget_cache("history", versioned=False)
+def history_snapshot(reg: str, hdir: str, seq: int) -> dict:
+    # история хранит основную группу полей: для списка, фильтров и сроков их и читаем
+    rows = history_rows(Path(hdir), seq, MAIN_FIELDS)
+    hashes = rows.pop("_hash").to_numpy(dtype=np.uint64)
+    df = derive_rows(compact_strings(rows)).assign(_hash=hashes)
+    return {
+        "version": f"history-{seq}",
+        "keys": df.index.tolist(),
+        "hashes": hashes,
+        "df": df,
+        "facets": build_facets(df),
+        "stats": {},
+        **snapshot_indexes(df),
+    }
+
+
+# =============================
+# DASHBOARD
+# =============================
+def summary_by(df: pd.DataFrame, by: str) -> pd.DataFrame:
+    """Сводка по району/отрасли: количество по статусам, суммы, готовность, доля без работ."""
+    keys = df[by].fillna("").astype(str).replace({"": "—"})
+    g = df.groupby(keys, sort=True)
+    out = pd.DataFrame(
+        {
+            "Объектов": g.size(),
+            "Цена контрактов, ₽": g["_n_contract_price"].sum(),
+            "Оплачено, ₽": g["_n_paid"].sum(),
+            "Ср. готовность, %": g["_n_readiness"].mean(),
+            "Без работ, %": (df["_works_color"] == "red").groupby(keys).mean() * 100,
+        }
+    )
+    status = df["status"].fillna("").astype(str).replace({"": "—"})
+    by_status = df.groupby([keys, status]).size().unstack(fill_value=0)
+    out = out.join(by_status)
+    if by == "sector":
+        out = out.loc[move_prochie_to_bottom(out.index.tolist())]
+
+    total = pd.DataFrame(
+        {
+            "Объектов": [len(df)],
+            "Цена контрактов, ₽": [df["_n_contract_price"].sum()],
+            "Оплачено, ₽": [df["_n_paid"].sum()],
+            "Ср. готовность, %": [df["_n_readiness"].mean()],
+            "Без работ, %": [(df["_works_color"] == "red").mean() * 100 if len(df) else np.nan],
+            **{c: [int(by_status[c].sum())] for c in by_status.columns},
+        },
+        index=["Итого"],
+    )
+    out = pd.concat([out, total])
+    out.index.name = "Район" if by == "district" else "Отрасль"
+    return out
+
+
+@budget_cache("dashboard")
+def dashboard_tables(reg: str, version: str, filters: tuple, _df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Кеш по (реестр, версия снимка, фильтры): повторный показ вкладки ничего не считает."""
+    return {"district": summary_by(_df, "district"), "sector": summary_by(_df, "sector")}
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def snapshot_memory(reg: str, version: str, _df: pd.DataFrame) -> pd.DataFrame:
+    return memory_report(_df)
+
+
+# =============================
+# DEADLINES
+# =============================
+# фильтр "Сроки": (колонка, от, до) в днях относительно сегодня; None — без границы
+DEADLINE_FILTERS = {"Все": None}
+for _c in RISK_DATE_COLS:
+    for _n in (30, 90):
+        DEADLINE_FILTERS[f"{CHANGE_KEY_RU[_c]}: ≤ {_n} дн."] = (_c, 0, _n)
+    DEADLINE_FILTERS[f"{CHANGE_KEY_RU[_c]}: срок прошёл"] = (_c, None, -1)
+
+
+def day_num(d: date) -> int:
+    return int(np.datetime64(d, "D").astype(np.int64))
+
+
+def date_range_positions(date_index: dict, col: str, start: date | None, end: date | None) -> np.ndarray:
+    """Позиции строк, у которых дата col в [start, end]."""
+    days, pos = date_index[col]
+    lo = 0 if start is None else np.searchsorted(days, day_num(start), side="left")
+    hi = len(days) if end is None else np.searchsorted(days, day_num(end), side="right")
+    return pos[lo:hi]
+
+
+def deadline_mask(date_index: dict, n: int, choice: str, today: date) -> np.ndarray:
+    m = np.zeros(n, dtype=bool)
+    col, lo, hi = DEADLINE_FILTERS[choice]
+    start = None if lo is None else today + timedelta(days=lo)
+    end = None if hi is None else today + timedelta(days=hi)
+    m[date_range_positions(date_index, col, start, end)] = True
+    return m
+
+
+def risk_list(df: pd.DataFrame, date_index: dict, mask: np.ndarray, horizon: int, overdue: bool, today: date) -> pd.DataFrame:
+    """Объекты со сроками в ближайшие horizon дней (и просроченные, если overdue)."""
+    start = None if overdue else today
+    end = today + timedelta(days=horizon)
+    frames = []
+    for c in RISK_DATE_COLS:
+        pos = date_range_positions(date_index, c, start, end)
+        pos = pos[mask[pos]]
+        if not len(pos):
+            continue
+        sub = df.iloc[pos]
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Объект": sub["name"].to_numpy(),
+                    "Район": sub["district"].to_numpy(),
+                    "Ответственный": sub["responsible"].to_numpy(),
+                    "Срок": CHANGE_KEY_RU[c],
+                    "Дата": sub[f"_d_{c}"].dt.date.to_numpy(),
+                    "Осталось, дн.": (sub[f"_d_{c}"] - pd.Timestamp(today)).dt.days.to_numpy(),
+                }
+            )
+        )
+    if not frames:
+        return pd.DataFrame(columns=["Объект", "Район", "Ответственный", "Срок", "Дата", "Осталось, дн."])
+    return pd.concat(frames, ignore_index=True).sort_values(["Осталось, дн.", "Объект"], kind="stable")
+
+
+@budget_cache("risk")
+def risk_report(
+    reg: str, version: str, filters: tuple, horizon: int, overdue: bool, today_iso: str, _snap: dict, _mask: np.ndarray
+) -> pd.DataFrame:
+    """Кеш по (реестр, версия снимка, фильтры, окно, день): даты считаются от сегодня."""
+    return risk_list(_snap["df"], _snap["date_index"], _mask, horizon, overdue, date.fromisoformat(today_iso))
+
+
+# =============================
+# DATA QUALITY
+# =============================
+# проверка -> подпись; всё считается по колонкам снимка, без обхода строк
+QUALITY_CHECKS = {
+    "stale_yellow": f"Обновлено {STALE_DAYS[0] + 1}–{STALE_DAYS[1]} дн. назад",
+    "stale_red": f"Не обновлялось > {STALE_DAYS[1]} дн.",
+    "no_update": "Нет даты обновления",
+    "no_price": "Нет цены контракта",
+    "no_rns": "Нет РНС",
+    "no_readiness": "Нет готовности",
+    "overpaid": "Оплачено больше цены",
+}
+
+
+def days_since(df: pd.DataFrame, columns: list[str], today: date) -> np.ndarray:
+    """Дней с последней из дат (по строкам); NaN, если дат нет."""
+    latest = np.full(len(df), np.nan)
+    for c in columns:
+        d = df[f"_d_{c}"]
+        days = d.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64).astype(float)
+        days[~d.notna().to_numpy()] = np.nan
+        latest = np.fmax(latest, days)
+    return day_num(today) - latest
+
+
+def quality_flags(df: pd.DataFrame, today: date) -> pd.DataFrame:
+    """Флаги проверок по строкам (как update_color: свежесть по карточке и по реестру)."""
+    age = days_since(df, ["card_updated_at", "updated_at"], today)
+    price = df["_n_contract_price"].to_numpy(dtype=float, na_value=np.nan)
+    paid = df["_n_paid"].to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(invalid="ignore"):
+        flags = {
+            "stale_yellow": (age > STALE_DAYS[0]) & (age <= STALE_DAYS[1]),
+            "stale_red": age > STALE_DAYS[1],
+            "no_update": np.isnan(age),
+            "no_price": np.isnan(price),
+            # в истории до появления колонки rns её нет — не считаем это замечанием
+            "no_rns": (df["rns"].astype(str).str.strip() == "").to_numpy() if "rns" in df else np.zeros(len(df), bool),
+            "no_readiness": df["_n_readiness"].isna().to_numpy(),
+            "overpaid": paid > price,
+        }
+    out = pd.DataFrame(flags, index=df.index)
+    out["_age"] = age
+    return out
+
+
+def quality_by(df: pd.DataFrame, flags: pd.DataFrame, by: str) -> pd.DataFrame:
+    """Сколько объектов с каждым замечанием — по ответственным или районам."""
+    keys = df[by].fillna("").astype(str).replace({"": "—"})
+    checks = flags[list(QUALITY_CHECKS)]
+    counts = checks.groupby(keys.to_numpy()).sum().rename(columns=QUALITY_CHECKS)
+    counts.insert(0, "С замечаниями", checks.any(axis=1).groupby(keys.to_numpy()).sum())
+    counts.insert(0, "Объектов", keys.groupby(keys.to_numpy()).size())
+    counts = counts.sort_values(["С замечаниями", "Объектов"], ascending=False)
+    total = counts.sum().to_frame("Итого").T
+    out = pd.concat([counts, total]).astype(int)
+    out.index.name = "Ответственный" if by == "responsible" else "Район"
+    return out
+
+
+def quality_list(df: pd.DataFrame, flags: pd.DataFrame) -> pd.DataFrame:
+    """Объекты с замечаниями, самые давно не обновлявшиеся — первыми."""
+    hit = flags[list(QUALITY_CHECKS)].any(axis=1).to_numpy()
+    notes = pd.Series("", index=df.index[hit])
+    for k, label in QUALITY_CHECKS.items():
+        notes = notes + np.where(flags[k].to_numpy()[hit], label + "; ", "")
+    sub = df[hit]
+    out = pd.DataFrame(
+        {
+            "Объект": sub["name"].astype(str).to_numpy(),
+            "Район": sub["district"].astype(str).to_numpy(),
+            "Ответственный": sub["responsible"].astype(str).to_numpy(),
+            "Дней без обновления": flags["_age"].to_numpy()[hit],
+            "Замечания": notes.str.rstrip("; ").to_numpy(),
+            "_key": sub.index.to_numpy(),
+        }
+    )
+    return out.sort_values("Дней без обновления", ascending=False, na_position="first", kind="stable")
+
+
+@budget_cache("quality")
+def quality_report(reg: str, version: str, filters: tuple, today_iso: str, _df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Кеш по (реестр, версия снимка, фильтры, день): свежесть зависит от сегодняшней даты."""
+    flags = quality_flags(_df, date.fromisoformat(today_iso))
+    return {
+        "responsible": quality_by(_df, flags, "responsible"),
+        "district": quality_by(_df, flags, "district"),
+        "objects": quality_list(_df, flags),
+    }
+
+
+# =============================
+# DUPLICATES
+# =============================
+# один объект из разных листов: "ФАП с. Ивановка" и "Фельдшерско-акушерский
+# пункт Ивановка". Сравниваем только внутри блока (район + тип объекта, тип
+# приведён по словарю сокращений) и только пары с общим не слишком частым
+# словом названия — всех пар реестра не перебираем. Слова типа блока ("детский
+# сад", "фап" со всеми формами) и вида поселения из названий убираются: они
+# общие у всего блока и сходства не доказывают
+DUP_MIN_SCORE = 0.6
+DUP_MAX_DF = 50  # слово, которое есть у большего числа объектов блока, пар не порождает
+# "с.", "д.", "п." отпадают как однобуквенные; остальное — полностью
+DUP_SETTLEMENT_WORDS = frozenset(
+    ["село", "деревня", "поселок", "пос", "пгт", "городского", "типа", "хутор", "слобода", "станица", "город"]
+)
+# с такого размера снимка блоки считаются в нескольких процессах. Замер: один
+# процесс — ~0.12 мс на строку (24 тыс. строк — 3 с, 60 тыс. — 7 с); запуск
+# процесса-исполнителя (spawn, импорт модуля) — ~1 с, плюс передача блоков.
+# На 24 тыс. строк пул медленнее (5.6 с против 3.0 с на одном ядре); выигрыш
+# заметен от ~50 тыс. строк при двух и более ядрах
+DUP_PARALLEL_ROWS = 50000
+DUP_WORKERS = os.cpu_count() or 1
+
+
+def dup_words(s) -> set[str]:
+    """Слова текста с формами словаря сокращений; однобуквенные ("с.", "д.") не в счёт."""
+    return {w for w in words_of(enrich_blob(norm_search(s))) if len(w) > 1 or w.isdigit()}
+
+
+def canonical_type(v) -> str:
+    """Тип объекта для блока: "ФАП" и "Фельдшерско-акушерский пункт" — один тип."""
+    t = norm_search(v)
+    owners = abbr_dictionary()["owners"].get(t)
+    return owners[0] if owners else t
+
+
+def word_idf(sets: list[set[str]]) -> dict[str, float]:
+    counts = {}
+    for ws in sets:
+        for w in ws:
+            counts[w] = counts.get(w, 0) + 1
+    return {w: math.log(1.0 + len(sets) / c) for w, c in counts.items()}
+
+
+def word_similarity(a: set[str], b: set[str], idf: dict[str, float]) -> float:
+    """
+    Среднее взвешенного Жаккара и доли общего в меньшем из наборов: слова,
+    которые есть только у одной записи ("МБОУ ..." перед "СОШ № 5"), не топят
+    оценку целиком.
+    """
+    common = sum(idf[w] for w in a & b)
+    union = sum(idf[w] for w in a | b)
+    smaller = min(sum(idf[w] for w in a), sum(idf[w] for w in b))
+    return (common / union + common / smaller) / 2.0 if smaller else 0.0
+
+
+def duplicate_block(names: list[str], addrs: list[str], drop: set[str]) -> tuple[list[tuple[int, int, float]], int]:
+    """
+    Пары внутри блока: (i, j, сходство) с i < j и число проверенных кандидатов.
+    Сходство — word_similarity слов названия без слов drop (веса — idf блока);
+    если адрес есть у обоих, он даёт треть оценки. Разные номера в названиях
+    ("школа 5" и "школа 12") — разные объекты.
+    """
+    name_w = [dup_words(s) - drop for s in names]
+    addr_w = [dup_words(s) for s in addrs]
+    nums = [{w for w in ws if w.isdigit()} for ws in name_w]
+    name_idf, addr_idf = word_idf(name_w), word_idf(addr_w)
+
+    postings = {}
+    for i, ws in enumerate(name_w):
+        for w in ws:
+            postings.setdefault(w, []).append(i)
+    candidates = set()
+    for p in postings.values():
+        if 1 < len(p) <= DUP_MAX_DF:
+            candidates.update(itertools.combinations(p, 2))
+
+    out = []
+    for i, j in candidates:
+        if nums[i] and nums[j] and not nums[i] & nums[j]:
+            continue
+        score = word_similarity(name_w[i], name_w[j], name_idf)
+        if addr_w[i] and addr_w[j]:
+            score = (2.0 * score + word_similarity(addr_w[i], addr_w[j], addr_idf)) / 3.0
+        if score >= DUP_MIN_SCORE:
+            out.append((i, j, score))
+    return out, len(candidates)
+
+
+def duplicate_chunk(blocks: list[tuple[np.ndarray, list[str], list[str], set[str]]]) -> list[tuple[np.ndarray, list, int]]:
+    """Пачка блоков для одного процесса: (позиции блока, пары, кандидатов)."""
+    return [(pos, *duplicate_block(names, addrs, drop)) for pos, names, addrs, drop in blocks]
+
+
+def find_duplicates(df: pd.DataFrame, workers: int = 1) -> pd.DataFrame:
+    """
+    Подозрения на дубли по снимку, самые похожие — первыми. Блоки независимы:
+    в большом снимке они раздаются workers процессам пачками примерно равного
+    числа строк.
+    """
+    t0 = time.perf_counter()
+    district = df["district"].astype(str).to_numpy()
+    otype = df["object_type"].astype(str).to_numpy()
+    names = df["name"].astype(str).to_numpy()
+    addrs = df["address"].astype(str).to_numpy()
+    dkey = [norm_search(d) for d in district]
+    tkey = pd.Series(otype).map(canonical_type).to_numpy()
+    block_key = pd.Series(dkey) + "\x1f" + pd.Series(tkey)
+    members = {k: list(pos) for k, pos in block_key.groupby(block_key.to_numpy(), sort=False).indices.items()}
+
+    # строка без типа: тип угадываем по названию ("Фельдшерско-акушерский пункт
+    # Ивановка" -> фап), не вышло — она идёт во все блоки своего района
+    abbr = abbr_dictionary()
+    typed = {}
+    for k in members:
+        d, t = k.split("\x1f")
+        if t:
+            typed.setdefault(d, []).append(k)
+    for i in np.flatnonzero(tkey == ""):
+        d = dkey[i]
+        guess = {f"{d}\x1f{a}" for p, _ in find_patterns(abbr["matcher"], norm_search(names[i])) for a in abbr["owners"][p]}
+        for k in [k for k in typed.get(d, []) if k in guess] or typed.get(d, []):
+            members[k].append(i)
+
+    groups = [np.asarray(pos) for pos in members.values() if len(pos) > 1]
+    groups.sort(key=len, reverse=True)
+    blocks = []
+    for pos in groups:
+        types = set(otype[pos].tolist())
+        drop = set(DUP_SETTLEMENT_WORDS).union(*(dup_words(t) | dup_words(canonical_type(t)) for t in types))
+        blocks.append((pos, names[pos].tolist(), addrs[pos].tolist(), drop))
+
+    used = 1
+    if workers > 1 and len(df) >= DUP_PARALLEL_ROWS and len(blocks) > 1:
+        n_chunks = min(len(blocks), workers * 4)
+        chunks, sizes = [[] for _ in range(n_chunks)], [0] * n_chunks
+        for blk in blocks:  # от крупных к мелким — в самую лёгкую пачку
+            k = sizes.index(min(sizes))
+            chunks[k].append(blk)
+            sizes[k] += len(blk[0])
+        used = min(workers, n_chunks)
+        # spawn, а не fork: в сервере рядом работают потоки с занятыми блокировками
+        with ProcessPoolExecutor(max_workers=used, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = [r for part in pool.map(duplicate_chunk, chunks) for r in part]
+    else:
+        results = duplicate_chunk(blocks)
+
+    first, second, scores = [], [], []
+    for pos, pairs, _ in results:
+        for i, j, s in pairs:
+            first.append(pos[i])
+            second.append(pos[j])
+            scores.append(s)
+    first, second = np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+    # пара строк без типа могла встретиться в нескольких блоках района
+    a, b = np.minimum(first, second), np.maximum(first, second)
+    out = pd.DataFrame(
+        {
+            "Сходство, %": np.round(np.asarray(scores, dtype=float) * 100),
+            "Объект 1": names[a],
+            "Адрес 1": addrs[a],
+            "Объект 2": names[b],
+            "Адрес 2": addrs[b],
+            "Район": district[a],
+            "Тип": otype[a],
+            "_key1": df.index.to_numpy()[a],
+            "_key2": df.index.to_numpy()[b],
+        }
+    )
+    out = out.sort_values(["Сходство, %", "Район", "Объект 1"], ascending=[False, True, True], kind="stable")
+    out = out.drop_duplicates(["_key1", "_key2"]).reset_index(drop=True)
+    out.attrs.update(
+        rows=len(df),
+        blocks=len(blocks),
+        candidates=sum(r[2] for r in results),
+        workers=used,
+        seconds=round(time.perf_counter() - t0, 3),
+    )
+    return out
+
+
+@budget_cache("duplicates")
+def duplicate_report(reg: str, version: str, _df: pd.DataFrame) -> pd.DataFrame:
+    """Кеш по версии снимка: пересчёт — только когда реестр изменился."""
+    return find_duplicates(_df, DUP_WORKERS)
+
+
+# =============================
+# SORT
+# =============================
+SORT_OPTIONS = {
+    "Как в реестре": None,
+    "Готовность ↓": ("readiness", True),
+    "Готовность ↑": ("readiness", False),
+    "Обновлено: сначала новые": ("card_updated_at", True),
+    "Обновлено: сначала старые": ("card_updated_at", False),
+    "Цена контракта ↓": ("contract_price", True),
+    "Цена контракта ↑": ("contract_price", False),
+    "Окончание (план): раньше": ("end_date_plan", False),
+    "Окончание (план): позже": ("end_date_plan", True),
+    "Наименование А→Я": ("name", False),
+    "Наименование Я→А": ("name", True),
+}
+
+
+def sorted_positions(sort_perms: dict, mask: np.ndarray, choice: str) -> np.ndarray:
+    """Готовая перестановка снимка, отфильтрованная маской, — без сортировки на каждом rerun."""
+    spec = SORT_OPTIONS.get(choice)
+    if spec is None:
+        return np.flatnonzero(mask)
+    key, desc = spec
+    perm = sort_perms[key][1 if desc else 0]
+    return perm[mask[perm]]
+
+
+# =============================
+# VIEW: filters -> rows (shared cache)
+# =============================
+# вид = (отрасль, район, статус, изменения, сроки, ранжирование, сегодня, запрос);
+# запрос — последним: уточнение сравнивает виды без него
+VIEW_FACETS = ["sector", "district", "status", "_change_ru"]
+
+
+def view_mask(snap: dict, view: tuple) -> np.ndarray:
+    """Маска фасетов и сроков вида (без поиска)."""
+    n = len(snap["df"])
+    mask = np.ones(n, dtype=bool)
+    for col, sel in zip(VIEW_FACETS, view[:4]):
+        if sel != "Все":
+            mask &= snap["facets"][col].get(str(sel), np.zeros(n, dtype=bool))
+    if view[4] != "Все":
+        mask &= deadline_mask(snap["date_index"], n, view[4], date.fromisoformat(view[6]))
+    return mask
+
+
+@budget_cache("view")
+def view_positions(reg: str, version: str, view: tuple, _snap: dict, _recent: OrderedDict) -> np.ndarray:
+    """
+    Позиции строк вида (в ранжированном режиме — по релевантности). Кеш общий
+    для всех сессий: одна и та же ссылка из утренней рассылки считается один
+    раз. _recent — результаты этой сессии, из них уточняется строгий запрос.
+    """
+    mask = view_mask(_snap, view)
+    qn, ranked = view[7], view[5]
+    if not qn:
+        return np.flatnonzero(mask)
+    if ranked:
+        index = _snap.get("search_index") or search_index(reg, version, _snap["df"])
+        return rank_search(index, qn, mask)
+    tokens = expand_query_tokens(qn)
+    base = refined_base(_recent, version, view, tokens)
+    return strict_positions(_snap["df"]["search_blob"].to_numpy(), np.flatnonzero(mask) if base is None else base, tokens)
+
+
+# =============================
+# SHARED SNAPSHOT (Arrow IPC)
+# =============================
+# SNAPSHOT_DIR/
+#   publisher.lock              — flock: один процесс на хосте обновляет реестр
+#   snapshot-<version>.arrow    — снимок + индексы, IPC без сжатия (mmap без копий)
+#   LATEST                      — версия последнего опубликованного снимка
+SHARED_KEEP = 3
+
+
+def shared_dir(reg: str) -> Path | None:
+    d = registry_setting(reg, "SNAPSHOT_DIR")
+    return Path(d) if d else None
+
+
+@st.cache_resource(show_spinner=False)
+def publisher_lock(reg: str) -> dict:
+    return {"fh": None}
+
+
+def is_publisher(reg: str, sdir: Path) -> bool:
+    """Первый процесс, взявший flock, публикует снимки; умер — лок берёт следующий."""
+    if fcntl is None:
+        return True
+    lock = publisher_lock(reg)
+    if lock["fh"] is not None:
+        return True
+    sdir.mkdir(parents=True, exist_ok=True)
+    fh = open(sdir / "publisher.lock", "a")
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return False
+    lock["fh"] = fh
+    return True
+
+
+def snapshot_table(snap: dict) -> pa.Table:
+    """
+    Снимок одной таблицей Arrow: строки + служебные колонки "__" (перестановки
+    сортировки, индекс дат, коды фасетов); остальное — в метаданных "registry".
+    """
+    n = len(snap["df"])
+    table = pa.Table.from_pandas(snap["df"].reset_index(), preserve_index=False)
+    meta = {"version": snap["version"], "columns": snap["columns"], "stats": snap["stats"], "date_counts": {}, "facets": {}}
+    for key, (asc, desc) in snap["sort_perms"].items():
+        table = table.append_column(f"__sort_{key}_asc", pa.array(asc, pa.int64()))
+        table = table.append_column(f"__sort_{key}_desc", pa.array(desc, pa.int64()))
+    for c, (days, pos) in snap["date_index"].items():
+        meta["date_counts"][c] = len(days)
+        pad = n - len(days)
+        table = table.append_column(f"__date_{c}_days", pa.array(np.concatenate([days, np.zeros(pad, np.int64)])))
+        table = table.append_column(f"__date_{c}_pos", pa.array(np.concatenate([pos, np.zeros(pad, np.int64)])))
+    for c, masks in snap["facets"].items():
+        codes = np.full(n, -1, dtype=np.int32)
+        for i, m in enumerate(masks.values()):
+            codes[m] = i
+        meta["facets"][c] = list(masks)
+        table = table.append_column(f"__facet_{c}", pa.array(codes))
+    return table.replace_schema_metadata({"registry": json.dumps(meta, ensure_ascii=False)})
+
+
+def write_ipc(table: pa.Table, path: Path) -> None:
+    """IPC без сжатия (mmap без копий); пишем во временный файл и подменяем."""
+    tmp = path.with_suffix(".tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def publish_snapshot(snap: dict, sdir: Path) -> None:
+    path = sdir / f"snapshot-{snap['version']}.arrow"
+    if path.exists():
+        os.utime(path)
+    else:
+        write_ipc(snapshot_table(snap), path)
+
+    latest_tmp = sdir / "LATEST.tmp"
+    latest_tmp.write_text(snap["version"], encoding="utf-8")
+    os.replace(latest_tmp, sdir / "LATEST")
+
+    # уже отображённые старые версии живут, пока открыты (unlink на POSIX безопасен)
+    old = sorted(sdir.glob("snapshot-*.arrow"), key=lambda p: p.stat().st_mtime)[:-SHARED_KEEP]
+    for p in old:
+        p.unlink(missing_ok=True)
+
+
+def map_snapshot(path: Path) -> dict:
+    """Открывает опубликованный снимок через mmap; колонки — ArrowDtype поверх отображения."""
+    mapped = pa.memory_map(str(path), "r").read_buffer()
+    # пока жив буфер, жив и mmap: регион снимаем вместе с ним
+    MAPPED_REGIONS[mapped.address] = mapped.address + mapped.size
+    weakref.finalize(mapped, MAPPED_REGIONS.pop, mapped.address, None)
+    table = pa.ipc.open_file(mapped).read_all()
+    meta = json.loads(table.schema.metadata[b"registry"])
+    aux = [c for c in table.column_names if c.startswith("__")]
+
+    def col(name: str) -> np.ndarray:
+        return table.column(name).to_numpy()
+
+    # словарные колонки (category) остаются category: коды копируются, значения общие
+    df = table.drop_columns(aux).to_pandas(
+        types_mapper=lambda t: None if pa.types.is_dictionary(t) else pd.ArrowDtype(t)
+    ).set_index("_key")
+    # коды фасетов лежат в снимке, пересчитывать маски по строкам не нужно
+    facets = {
+        c: {v: codes == i for i, v in enumerate(values)}
+        for c, values in meta.get("facets", {}).items()
+        for codes in [col(f"__facet_{c}")]
+    } or build_facets(df)
+    return {
+        "version": meta["version"],
+        "columns": meta["columns"],
+        "keys": df.index,
+        "hashes": col("_hash"),
+        "df": df,
+        "facets": facets,
+        "stats": meta["stats"],
+        "mapped": mapped,
+        "built_at": path.stat().st_mtime,
+        "sort_perms": {k: (col(f"__sort_{k}_asc"), col(f"__sort_{k}_desc")) for k in SORT_KEYS},
+        "date_index": {
+            c: (col(f"__date_{c}_days")[:cnt], col(f"__date_{c}_pos")[:cnt]) for c, cnt in meta["date_counts"].items()
+        },
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def mapped_store(reg: str) -> dict:
+    return {"version": None, "snap": None}
+
+
+def shared_snapshot(reg: str, sdir: Path) -> dict | None:
+    latest = sdir / "LATEST"
+    if not latest.exists():
+        return None
+    version = latest.read_text(encoding="utf-8").strip()
+    store = mapped_store(reg)
+    if store["version"] != version:
+        path = sdir / f"snapshot-{version}.arrow"
+        if not path.exists():
+            return store["snap"]
+        store["snap"] = map_snapshot(path)
+        store["version"] = version
+        metric_inc("registry_cache_misses_total", registry=reg, cache="snapshot")
+    try:  # издатель трогает файл на каждом обновлении — возраст считаем от этого
+        store["snap"]["built_at"] = (sdir / f"snapshot-{version}.arrow").stat().st_mtime
+    except OSError:
+        pass
+    return store["snap"]
+
+
+# =============================
+# ARTIFACT (offline build)
+# =============================
+# ARTIFACT_DIR/ — собирает build.py заранее, приложение только отображает:
+#   <version>/snapshot.arrow   — как в SNAPSHOT_DIR (+ коды фасетов)
+#   <version>/passport.arrow   — паспортные поля, индекс _key
+#   <version>/search/*.npy     — ранжированный индекс, np.load(mmap_mode="r")
+#   <version>/manifest.json    — версия, время сборки, строки, источники
+#   LATEST                     — версия последней собранной
+ARTIFACT_FORMAT = 1
+ARTIFACT_KEEP = 3
+
+
+def artifact_dir(reg: str) -> Path | None:
+    d = registry_setting(reg, "ARTIFACT_DIR")
+    return Path(d) if d else None
+
+
+def build_artifact(reg: str, out: Path, sources: tuple[str, ...] | None = None, keep: int = ARTIFACT_KEEP) -> dict:
+    """
+    Весь конвейер заранее: загрузка → normalize_schema → снимок (типы, blob'ы,
+    фасеты, сортировки, даты) → поисковый индекс → паспорт. Каталог версии
+    пишется во временный и переименовывается целиком, затем LATEST.
+    """
+    t0 = time.perf_counter()
+    raw = load_data(reg, tuple(MAIN_FIELDS), sources)
+    if raw.empty:
+        raise ValueError("Реестр пустой: проверьте источники")
+    snap = prepare_snapshot(raw)
+    index = build_search_index(snap["df"]["search_blob"].astype(str).tolist(), snap["df"]["name"].astype(str).tolist())
+    passport = passport_from_raw(load_data(reg, None, sources), tuple(snap["columns"]))
+
+    out.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": snap["version"],
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "rows": len(snap["df"]),
+        "registry": reg,
+        "sources": len(sources or source_list(reg)) or 1,
+        "stats": snap["stats"],
+    }
+    final = out / snap["version"]
+    if not final.exists():
+        tmp = out / f".{snap['version']}.tmp"
+        tmp.mkdir()
+        write_ipc(snapshot_table(snap), tmp / "snapshot.arrow")
+        write_ipc(pa.Table.from_pandas(passport.reset_index(), preserve_index=False), tmp / "passport.arrow")
+        save_search_index(index, tmp / "search")
+        manifest["seconds"] = round(time.perf_counter() - t0, 3)
+        (tmp / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, final)
+    os.utime(final)
+
+    latest_tmp = out / "LATEST.tmp"
+    latest_tmp.write_text(snap["version"], encoding="utf-8")
+    os.replace(latest_tmp, out / "LATEST")
+
+    versions = sorted((p for p in out.iterdir() if (p / "manifest.json").exists()), key=lambda p: p.stat().st_mtime)
+    for p in versions[:-keep]:
+        for f in sorted(p.rglob("*"), reverse=True):
+            f.unlink() if f.is_file() else f.rmdir()
+        p.rmdir()
+    return json.loads((final / "manifest.json").read_text(encoding="utf-8"))
+
+
+@st.cache_resource(show_spinner=False)
+def artifact_store(reg: str) -> dict:
+    return {"version": None, "snap": None}
+
+
+def artifact_snapshot(reg: str, adir: Path) -> dict | None:
+    """Снимок из собранного артефакта; перечитывается, когда меняется LATEST."""
+    latest = adir / "LATEST"
+    if not latest.exists():
+        return None
+    version = latest.read_text(encoding="utf-8").strip()
+    store = artifact_store(reg)
+    if store["version"] != version:
+        vdir = adir / version
+        if not (vdir / "manifest.json").exists():
+            return store["snap"]
+        manifest = json.loads((vdir / "manifest.json").read_text(encoding="utf-8"))
+        if manifest.get("format") != ARTIFACT_FORMAT:
+            return store["snap"]
+        snap = map_snapshot(vdir / "snapshot.arrow")
+        snap["search_index"] = load_search_index(vdir / "search", len(snap["df"]))
+        store["snap"] = snap
+        store["version"] = version
+        metric_inc("registry_cache_misses_total", registry=reg, cache="snapshot")
+    try:  # build.py трогает каталог версии при каждой сборке
+        store["snap"]["built_at"] = (adir / version).stat().st_mtime
+    except OSError:
+        pass
+    return store["snap"]
+
+
+def artifact_file(reg: str, version: str, name: str) -> Path | None:
+    adir = artifact_dir(reg)
+    if adir is None:
+        return None
+    path = adir / version / name
+    return path if path.exists() else None
+
+
+@st.cache_resource(show_spinner=False)
+def snapshot_store(reg: str) -> dict:
+    return {"snap": None, "history": None}
+
+
+@st.cache_resource(show_spinner=False, ttl=120)
+def current_snapshot(reg: str) -> dict | None:
+    raw = load_data(reg, tuple(MAIN_FIELDS))
+    if raw.empty:
+        return None
+    store = snapshot_store(reg)
+    store["snap"] = prepare_snapshot(raw, store["snap"])
+    metric_inc("registry_cache_misses_total", registry=reg, cache="snapshot")
+    for kind in ("inserted", "updated", "deleted"):
+        metric_inc("registry_snapshot_changes_total", store["snap"]["stats"][kind], registry=reg, kind=kind)
+
+    hdir = history_dir(reg)
+    if hdir is not None:
+        try:
+            if store["history"] is None:
+                store["history"] = history_state(hdir)
+            record_history(store["snap"], store["history"], hdir)
+        except Exception:
+            store["history"] = None
+
+    sdir = shared_dir(reg)
+    if sdir is not None and is_publisher(reg, sdir):
+        try:
+            publish_snapshot(store["snap"], sdir)
+        except Exception:
+            pass
+    return store["snap"]
+
+
+def get_snapshot(reg: str) -> dict | None:
+    """Снимок реестра для страницы: собранный build.py, свой (или мы издатель) либо из SNAPSHOT_DIR."""
+    snap = find_snapshot(reg)
+    metric_inc("registry_cache_requests_total", registry=reg, cache="snapshot")
+    if snap is not None:
+        cache_switch(reg, snap)
+        metric_set("registry_snapshot_rows", len(snap["df"]), registry=reg)
+        metric_set("registry_snapshot_timestamp_seconds", snap.get("built_at", 0.0), registry=reg)
+    return snap
+
+
+def find_snapshot(reg: str) -> dict | None:
+    adir = artifact_dir(reg)
+    if adir is not None:
+        snap = artifact_snapshot(reg, adir)
+        if snap is not None:
+            return snap
+    sdir = shared_dir(reg)
+    if sdir is None or is_publisher(reg, sdir):
+        return current_snapshot(reg)
+    snap = shared_snapshot(reg, sdir)
+    return snap if snap is not None else current_snapshot(reg)
+
+
+# =============================
+# STATIC ASSETS
+# =============================
+@st.cache_resource(show_spinner=False)
+def static_assets() -> dict:
+    css = (Path(__file__).parent / "assets" / "style.css").read_text(encoding="utf-8")
+    return {
+        "style_html": html_clean(f"<style>\n{css}\n</style>"),
+        "crest_b64": read_local_crest_b64(),
+    }
+
+
+# =============================
+# WARM-UP
+# =============================
+@st.cache_resource(show_spinner=False)
+def warmup_status(reg: str) -> dict:
+    return {"state": "idle", "started_at": None, "seconds": None, "rows": 0, "version": None, "error": None}
+
+
+def warm_up(reg: str) -> dict:
+    """Собирает снимок реестра, индексы и статику заранее, чтобы первый посетитель не ждал."""
+    status = warmup_status(reg)
+    status.update(state="warming", started_at=datetime.now().isoformat(timespec="seconds"), error=None)
+    t0 = time.perf_counter()
+    try:
+        static_assets()
+        snap = get_snapshot(reg)
+        if snap is None:
+            status.update(state="failed", error="Реестр пустой: проверьте CSV_URL или .xlsx")
+        else:
+            status.update(state="ready", rows=len(snap["df"]), version=snap["version"])
+    except Exception as e:
+        status.update(state="failed", error=repr(e))
+    status["seconds"] = round(time.perf_counter() - t0, 3)
+    return status
+
+
+# =============================
+# METRICS (Prometheus text format)
+# =============================
+# имя -> (тип, описание[, границы гистограммы])
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+METRICS = {
+    "registry_refresh_seconds": ("histogram", "Длительность load_data (загрузка и разбор источников)", LATENCY_BUCKETS),
+    "registry_refresh_timestamp_seconds": ("gauge", "Время последней удачной загрузки, unix"),
+    "registry_data_source": ("gauge", "Откуда взяты данные: sources (CSV_URL), xlsx_fallback, none"),
+    "registry_source_rows": ("gauge", "Строк в последней загрузке"),
+    "registry_source_up": ("gauge", "Источник из CSV_URL прочитан при последней попытке (1) или взят из прошлой удачной (0)"),
+    "registry_source_last_success_timestamp_seconds": ("gauge", "Последняя удачная загрузка источника, unix"),
+    "registry_snapshot_rows": ("gauge", "Строк в текущем снимке"),
+    "registry_snapshot_timestamp_seconds": ("gauge", "Когда текущий снимок собран или обновлён, unix"),
+    "registry_snapshot_age_seconds": ("gauge", "Возраст текущего снимка, с"),
+    "registry_snapshot_changes_total": ("counter", "Строк вставлено/изменено/удалено при сборках снимка (первая — всё вставлено)"),
+    "registry_cache_requests_total": ("counter", "Обращений к кешу: snapshot и кеши бюджета (view, cards, search, ...)"),
+    "registry_cache_misses_total": ("counter", "Промахов кеша (пересчётов)"),
+    "registry_cache_bytes": ("gauge", "Оценка памяти кеша, байт (snapshot — закреплённый текущий снимок)"),
+    "registry_cache_entries": ("gauge", "Записей в кеше"),
+    "registry_cache_evictions_total": ("counter", "Вытеснено записей по бюджету памяти"),
+    "registry_cache_invalidations_total": ("counter", "Снято записей при смене версии снимка"),
+    "registry_cache_budget_bytes": ("gauge", "Бюджет памяти кешей реестра (CACHE_BUDGET_MB), байт"),
+    "registry_view_seconds": ("histogram", "Время отбора строк: filter, search, ranked", LATENCY_BUCKETS),
+    "registry_rerun_seconds": ("histogram", "Время перезапуска скрипта страницы", LATENCY_BUCKETS),
+    "registry_rendered_bytes": ("histogram", "Байт HTML карточек за перезапуск", BYTES_BUCKETS),
+    "registry_active_sessions": ("gauge", "Сессий с перезапуском за последние SESSION_ACTIVE_SECONDS"),
+}
+SESSION_ACTIVE_SECONDS = 300
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_store() -> dict:
+    """Значения метрик процесса; ключ — (имя, метки). Общие для всех сессий."""
+    return {"lock": threading.Lock(), "values": {}, "histograms": {}, "sessions": {}}
+
+
+def metric_key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def metric_inc(name: str, value: float = 1.0, **labels) -> None:
+    store = metrics_store()
+    key = metric_key(name, labels)
+    with store["lock"]:
+        store["values"][key] = store["values"].get(key, 0.0) + value
+
+
+def metric_set(name: str, value: float, **labels) -> None:
+    store = metrics_store()
+    with store["lock"]:
+        store["values"][metric_key(name, labels)] = float(value)
+
+
+def metric_observe(name: str, value: float, **labels) -> None:
+    bounds = METRICS[name][2]
+    store = metrics_store()
+    key = metric_key(name, labels)
+    with store["lock"]:
+        h = store["histograms"].get(key)
+        if h is None:
+            h = store["histograms"][key] = {"buckets": [0] * len(bounds), "sum": 0.0, "count": 0}
+        for i, b in enumerate(bounds):
+            if value <= b:
+                h["buckets"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+
+def session_seen(session_id: str) -> None:
+    store = metrics_store()
+    with store["lock"]:
+        store["sessions"][session_id] = time.time()
+
+
+def metric_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{prom_escape(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def prom_escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def metrics_text() -> str:
+    """
+    Снимок метрик в текстовом формате Prometheus 0.0.4. Значения, которые
+    выгоднее считать при чтении (возраст снимка, состояние источников,
+    активные сессии), досчитываются здесь; lock держится только на копирование.
+    """
+    store = metrics_store()
+    now = time.time()
+    with store["lock"]:
+        sessions = store["sessions"]
+        for sid in [s for s, t in sessions.items() if now - t > SESSION_ACTIVE_SECONDS]:
+            del sessions[sid]
+        values = dict(store["values"])
+        histograms = {k: {**h, "buckets": list(h["buckets"])} for k, h in store["histograms"].items()}
+        values[metric_key("registry_active_sessions", {})] = float(len(sessions))
+
+    status = source_store()["status"]
+    for reg in registry_ids():
+        cache = cache_store(reg)
+        with cache["lock"]:
+            caches = {name: dict(stats) for name, stats in cache["stats"].items()}
+            values[metric_key("registry_cache_budget_bytes", {"registry": reg})] = float(cache["budget"])
+        for name, cs in caches.items():
+            labels = {"registry": reg, "cache": name}
+            if name != "snapshot":
+                values[metric_key("registry_cache_requests_total", labels)] = float(cs["hits"] + cs["misses"])
+                values[metric_key("registry_cache_misses_total", labels)] = float(cs["misses"])
+            values[metric_key("registry_cache_bytes", labels)] = float(cs["bytes"])
+            values[metric_key("registry_cache_entries", labels)] = float(cs["entries"])
+            values[metric_key("registry_cache_evictions_total", labels)] = float(cs["evictions"])
+            values[metric_key("registry_cache_invalidations_total", labels)] = float(cs["invalidated"])
+
+        built = values.get(metric_key("registry_snapshot_timestamp_seconds", {"registry": reg}))
+        if built:
+            values[metric_key("registry_snapshot_age_seconds", {"registry": reg})] = now - built
+        # источники — по номеру в CSV_URL: в ссылках бывают ключи доступа
+        for i, src in enumerate(source_list(reg)):
+            if src in status:
+                kind = "xlsx" if Path(src.split("?")[0]).suffix.lower() in (".xlsx", ".xlsm") else "csv"
+                labels = {"registry": reg, "source": i, "kind": kind}
+                values[metric_key("registry_source_up", labels)] = float(status[src]["ok"])
+                if status[src]["at"]:
+                    values[metric_key("registry_source_last_success_timestamp_seconds", labels)] = status[src]["at"]
+
+    lines = []
+    for name, spec in METRICS.items():
+        kind, help_text = spec[0], spec[1]
+        series = sorted((k, v) for k, v in values.items() if k[0] == name)
+        hseries = sorted((k, h) for k, h in histograms.items() if k[0] == name)
+        if not series and not hseries:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (_, labels), v in series:
+            lines.append(f"{name}{metric_labels(labels)} {v!r}")
+        for (_, labels), h in hseries:
+            for b, c in zip(spec[2], h["buckets"]):
+                le = 'le="%g"' % b
+                lines.append(f"{name}_bucket{metric_labels(labels, le)} {c}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{metric_labels(labels, le)} {h['count']}")
+            lines.append(f"{name}_sum{metric_labels(labels)} {h['sum']!r}")
+            lines.append(f"{name}_count{metric_labels(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
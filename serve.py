@@ -0,0 +1,67 @@
+"""
+Запуск с прогревом кешей при старте сервера:
+
+    streamlit run serve.py
+
+Снимки реестров, индексы и статика собираются в фоне сразу после старта
+процесса, а не на первом посетителе; у каждого реестра из [registries] свой
+поток обновления; он же после каждой новой версии снимка ищет дубли объектов
+(на /ready это не влияет). GET /ready отвечает 200, когда прогреты все
+реестры, и 503 до этого — health check балансировщика держит трафик.
+
+GET /metrics — метрики в текстовом формате Prometheus: возраст снимка и время
+загрузки, состояние источников, доля попаданий в кеши, время фильтров и
+поиска, объём карточек за перезапуск, активные сессии. Обработчик синхронный:
+Starlette выполняет его в пуле потоков, мимо event loop и потоков скриптов.
+"""
+import os
+import threading
+from contextlib import asynccontextmanager
+
+import streamlit as st
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from registry import duplicate_report, get_snapshot, metrics_text, registry_ids, warm_up, warmup_status
+
+# как часто фоновый поток дёргает снимок, чтобы обновление (ttl=120) не ложилось на посетителя
+REFRESH_EVERY = int(os.environ.get("REGISTRY_REFRESH_EVERY", "60"))
+
+
+def refresher(reg: str, stop: threading.Event) -> None:
+    warm_up(reg)
+    while True:
+        try:
+            snap = get_snapshot(reg)
+            # поиск дублей новой версии — здесь, а не при открытии вкладки «Дубли»
+            if snap is not None:
+                duplicate_report(reg, snap["version"], snap["df"])
+        except Exception:
+            pass
+        if stop.wait(REFRESH_EVERY):
+            break
+
+
+@asynccontextmanager
+async def lifespan(app):
+    stop = threading.Event()
+    for reg in registry_ids():
+        threading.Thread(target=refresher, args=(reg, stop), name=f"registry-warmup-{reg}", daemon=True).start()
+    yield
+    stop.set()
+
+
+async def ready(request):
+    regs = {reg: dict(warmup_status(reg)) for reg in registry_ids()}
+    ok = all(status["state"] == "ready" for status in regs.values())
+    return JSONResponse({"state": "ready" if ok else "warming", "registries": regs}, status_code=200 if ok else 503)
+
+
+def metrics(request):
+    return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+app = st.App("app.py", lifespan=lifespan, routes=[Route("/ready", ready), Route("/metrics", metrics)])
+
+if __name__ == "__main__":
+    app.run()